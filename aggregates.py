@@ -0,0 +1,38 @@
+"""
+Running rating aggregates for first-party feedback: count, sum and a 1-5
+histogram over the rows that are approved and publishable.
+
+The feedback view calls add()/remove() as rows arrive and moderation events
+are applied, so keeping the numbers current costs O(1) per change, in every
+worker. FeedbackStore persists the numbers tagged with the signature of the
+files they were computed from, so a fresh worker can show them without
+rebuilding the view first; a snapshot whose files have changed since is
+ignored and the numbers are rebuilt from the rows + moderation log.
+"""
+
+
+class RatingAggregate:
+    __slots__ = ("count", "total", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.histogram = [0] * 5   # histogram[i] = number of (i + 1)-star ratings
+
+    def add(self, rating, n=1):
+        if 1 <= rating <= 5:
+            self.count += n
+            self.total += rating * n
+            self.histogram[rating - 1] += n
+
+    def remove(self, rating):
+        if 1 <= rating <= 5 and self.histogram[rating - 1]:
+            self.count -= 1
+            self.total -= rating
+            self.histogram[rating - 1] -= 1
+
+    def summary(self):
+        """{"count", "average" (one decimal, None when empty), "histogram" [1-star .. 5-star]}."""
+        return {"count": self.count,
+                "average": round(self.total / self.count, 1) if self.count else None,
+                "histogram": list(self.histogram)}
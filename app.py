@@ -1,11 +1,30 @@
-from flask import Flask, request, redirect, url_for, render_template_string, flash, session
-import csv, os, json, time
+from flask import (
+    Flask, Response, request, redirect, url_for, render_template, flash, session,
+    make_response, abort, stream_with_context,
+)
+from markupsafe import escape
+import csv, os, json, time, zlib
+import bisect, functools, threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-import base64
-import glob, mimetypes
-import socket
-from urllib import request as urlreq
-from urllib.parse import urlencode
+import re
+import hashlib
+import hmac
+
+try:
+    import brotli   # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+from metrics import Metrics
+from places import CircuitBreaker, PlacesClient
+from ratelimit import make_limiter
+from search import FeedbackSearch, MessageSearch
+from storage import (
+    CONTACT_FIELDS, FEEDBACK_FIELDS, MODERATION_ACTIONS,
+    AppendOnlyCSV, Feedback, FeedbackStore, JSONFile, SQLiteDB, SQLiteFeedback, SQLiteSubmissions, WriteBehind,
+    new_record_id, parse_timestamp, try_lock_file, unlock_file,
+)
 
 # -------- Settings --------
 HOST = "0.0.0.0"
@@ -24,60 +43,262 @@ GOOGLE_MAPS_LINK = os.getenv("GOOGLE_MAPS_LINK",
     "https://maps.app.goo.gl/FieUSEzzFGYYun6eA?g_st=ipc"
 ).strip()
 GOOGLE_CACHE_FILE = "google_rating_cache.json"
+GOOGLE_CACHE_LOCK_FILE = GOOGLE_CACHE_FILE + ".lock"
 GOOGLE_CACHE_TTL_SECONDS = 4 * 60 * 60  # 4 hours  [UPDATED]
 
 app = Flask(__name__)
 app.secret_key = "littlezs-dev"   # change for deployment
 
+# -------- Metrics (admin /metrics, Prometheus text format) --------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()   # lets a scraper in with "Authorization: Bearer <token>"
+metrics = Metrics(prefix="littlezs", enabled=METRICS_ENABLED)
+
+if METRICS_ENABLED:
+    @app.before_request
+    def _metrics_start():
+        metrics.start_request(request.endpoint or "unmatched")
+
+    @app.after_request
+    def _metrics_end(resp):
+        metrics.end_request(resp.status_code, None if resp.is_streamed else resp.calculate_content_length())
+        return resp
+
 # -------- Data files --------
 CSV_FILE = "contact_submissions.csv"
 FEEDBACK_FILE = "feedback.csv"
 
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow(["timestamp", "name", "email", "phone", "message"])
-
-if not os.path.exists(FEEDBACK_FILE):
-    with open(FEEDBACK_FILE, "w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow(
-            ["id","timestamp","name","relationship","rating","comment","can_publish","approved"]
-        )
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv").strip().lower()   # "csv" or "sqlite"
+SQLITE_FILE = os.getenv("SQLITE_FILE", "littlezs.db")
+# WRITE_BEHIND=1: form POSTs queue their row and a writer thread appends in batches
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "1000"))
+# off the request path an fsync per batch is cheap, so that becomes the default
+STORAGE_FSYNC_INTERVAL_SECONDS = float(os.getenv("STORAGE_FSYNC_INTERVAL_SECONDS", "0" if WRITE_BEHIND else "1.0"))
+FEEDBACK_EVENTS_FILE = "feedback_events.csv"
+FEEDBACK_COMPACT_AFTER = int(os.getenv("FEEDBACK_COMPACT_AFTER", "500"))
+# rating aggregates snapshot, so a fresh worker can show them before loading every row
+FEEDBACK_RATINGS_FILE = "feedback_ratings.json"
+
+# Opened on first use (a request, warm_up() or create_app() + a request), not at
+# import: importing app.py touches no files.
+submissions = feedback_store = None
+write_queues = {}
+save_contact = save_feedback = None
+_storage_lock = threading.Lock()
+
+def init_storage():
+    """Open the stores and everything built on them. Safe to call again; only the first call does the work."""
+    global submissions, feedback_store, write_queues, save_contact, save_feedback
+    global testimonials_view, message_search, feedback_search
+    with _storage_lock:
+        if feedback_store is not None:
+            return
+        if STORAGE_BACKEND == "sqlite":
+            # import existing CSVs once with: python storage.py import-sqlite littlezs.db contact_submissions.csv feedback.csv feedback_events.csv
+            db = SQLiteDB(SQLITE_FILE)
+            subs = SQLiteSubmissions(db, CONTACT_FIELDS)
+            store = SQLiteFeedback(db, FEEDBACK_FIELDS)
+        else:
+            # append-only + fcntl-locked, so gunicorn workers can't interleave rows
+            subs = AppendOnlyCSV(CSV_FILE, CONTACT_FIELDS, fsync_interval=STORAGE_FSYNC_INTERVAL_SECONDS)
+            # new rows + moderation events are appended; reads go through a materialized view
+            store = FeedbackStore(FEEDBACK_FILE, FEEDBACK_EVENTS_FILE, FEEDBACK_FIELDS,
+                                  fsync_interval=STORAGE_FSYNC_INTERVAL_SECONDS,
+                                  compact_after=FEEDBACK_COMPACT_AFTER,
+                                  snapshot_path=FEEDBACK_RATINGS_FILE)
+        subs.ensure()
+        store.ensure()
+        metrics.instrument(subs, "storage_read", "rows", "page", "count", "tail")
+        metrics.instrument(subs, "storage_write", "append", "append_many")
+        metrics.instrument(store, "storage_read", "rows", "get", "ratings")
+        metrics.instrument(store, "storage_write", "add", "add_many", "moderate")
+
+        if WRITE_BEHIND:
+            write_queues = {
+                "contact": WriteBehind(subs.append_many, WRITE_BEHIND_QUEUE_SIZE, name="contact-writer"),
+                "feedback": WriteBehind(store.add_many, WRITE_BEHIND_QUEUE_SIZE, name="feedback-writer"),
+            }
+            save_contact = write_queues["contact"].put
+            save_feedback = write_queues["feedback"].put
+        else:
+            write_queues = {}
+            save_contact = subs.append
+            save_feedback = store.add
+        save_contact = metrics.timed("storage_write", save_contact)     # with write-behind: just the enqueue
+        save_feedback = metrics.timed("storage_write", save_feedback)
+
+        testimonials_view = TestimonialsView(store)
+        message_search = MessageSearch(subs, CONTACT_FIELDS)
+        feedback_search = FeedbackSearch(store)
+        submissions = subs
+        feedback_store = store   # last: it is the "initialized" flag
+
+def reset_storage():
+    """Flush and drop the stores (and write-behind queues) so the next use reopens them with the current settings."""
+    global submissions, feedback_store, write_queues
+    with _storage_lock:
+        for q in write_queues.values():
+            q.close()   # flushed, writer stopped, exit hook dropped
+        submissions = feedback_store = None
+        write_queues = {}
+
+@app.before_request
+def _open_storage():
+    if feedback_store is None:
+        init_storage()
+
+def flush_writes(timeout=10.0):
+    """Drain the write-behind queues (also runs at exit; call from a gunicorn worker_exit hook too)."""
+    return all(q.flush(timeout) for q in write_queues.values())
 
 # -------- Logo helper --------
-def logo_data_url():
-    """Return data:image/...;base64,... for any logo file (png, jpg, jpeg)."""
+# Discovered + hashed once; re-scanned only when the file's mtime changes.
+_logo = None   # {"name", "mtime", "mime", "data", "digest"}
+
+def _scan_logo():
+    import glob, mimetypes   # only needed when the logo (re)appears
+    global _logo
     for name in sorted(glob.glob("logo*")):  # logo.png, logo.jpg, logo.jpeg...
         if os.path.isfile(name):
-            mime = mimetypes.guess_type(name)[0] or "image/png"
             with open(name, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("ascii")
-            return f"data:{mime};base64,{b64}"
+                data = f.read()
+            _logo = {
+                "name": name,
+                "mtime": os.path.getmtime(name),
+                "mime": mimetypes.guess_type(name)[0] or "image/png",
+                "data": data,
+                "digest": hashlib.sha256(data).hexdigest()[:16],
+            }
+            return _logo
+    _logo = None
     return None
 
-# -------- Google rating helpers (optional) --------
-def _load_google_cache():
+@metrics.timed("logo")
+def logo_asset():
+    """Return the cached logo dict (name, mime, data, digest), or None if there is no logo."""
+    logo = _logo
     try:
-        if os.path.exists(GOOGLE_CACHE_FILE):
-            with open(GOOGLE_CACHE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if time.time() - float(data.get("_ts", 0)) < GOOGLE_CACHE_TTL_SECONDS:
-                return data
-    except Exception:
+        if logo and os.path.getmtime(logo["name"]) == logo["mtime"]:
+            return logo
+    except OSError:
         pass
-    return None
+    return _scan_logo()
+
+def logo_url(logo=None):
+    """Content-hash URL for the logo (safe to cache forever), or None."""
+    logo = logo or logo_asset()
+    if not logo:
+        return None
+    ext = os.path.splitext(logo["name"])[1].lstrip(".") or "png"
+    return url_for("logo_file", digest=logo["digest"], ext=ext)
+
+# -------- Google rating helpers (optional) --------
+# Requests never wait on Places: they get the last known value (even if it is
+# past GOOGLE_CACHE_TTL_SECONDS) and a stale/missing value kicks off one
+# background refresh (one thread per process, one fetch across workers via a
+# lock file). Failures back off exponentially with jitter.
+GOOGLE_PLACES_URL = os.getenv("GOOGLE_PLACES_URL",
+    "https://maps.googleapis.com/maps/api/place/details/json"
+).strip()
+GOOGLE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_CONNECT_TIMEOUT_SECONDS", "3"))
+GOOGLE_FETCH_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_FETCH_TIMEOUT_SECONDS", "8"))   # read timeout
+GOOGLE_BREAKER_FAILURES = int(os.getenv("GOOGLE_BREAKER_FAILURES", "3"))
+GOOGLE_BACKOFF_BASE_SECONDS = 30
+GOOGLE_BACKOFF_MAX_SECONDS = 60 * 60
+
+_google_lock = threading.Lock()
+_google_refresh = {"running": False, "retry_at": 0.0}   # retry_at: another worker held the lock file
+_google_breaker = CircuitBreaker(GOOGLE_BREAKER_FAILURES, GOOGLE_BACKOFF_BASE_SECONDS, GOOGLE_BACKOFF_MAX_SECONDS)
+_places = None            # PlacesClient for the current GOOGLE_PLACES_URL (keep-alive pool)
+_google_mem = {}          # place_id -> payload (tier one, per process)
+
+def _read_google_file(data):
+    data["_ts"] = float(data.get("_ts", 0))
+    _google_mem[data.get("place_id") or GOOGLE_PLACE_ID] = data
+    return data
+
+_google_file = JSONFile(GOOGLE_CACHE_FILE, _read_google_file)   # shared by workers, tier two
+
+def _load_google_cache():
+    """
+    Cached payload for GOOGLE_PLACE_ID (fresh or stale), or None.
+    Tier one is _google_mem; the shared file is only re-read when its mtime/size changed.
+    """
+    _google_file.read()
+    return _google_mem.get(GOOGLE_PLACE_ID)
 
 def _save_google_cache(payload):
+    payload["_ts"] = time.time()
+    payload["place_id"] = GOOGLE_PLACE_ID
+    _google_mem[GOOGLE_PLACE_ID] = payload
+    _google_file.write(payload)
+
+def _google_cache_fresh(cached):
+    return bool(cached) and time.time() - cached["_ts"] < GOOGLE_CACHE_TTL_SECONDS
+
+def places_client():
+    global _places
+    if _places is None or _places.url != GOOGLE_PLACES_URL:
+        _places = PlacesClient(GOOGLE_PLACES_URL, GOOGLE_CONNECT_TIMEOUT_SECONDS, GOOGLE_FETCH_TIMEOUT_SECONDS)
+    return _places
+
+def _fetch_google_live():
+    """Place Details call (rating + user_ratings_total). Blocking; raises on failure."""
+    params = {
+        "place_id": GOOGLE_PLACE_ID,
+        "fields": "rating,user_ratings_total",
+        "key": GOOGLE_PLACES_API_KEY
+    }
+    data = places_client().get_json(params)
+    result = data.get("result", {}) if isinstance(data, dict) else {}
+    return {"rating": result.get("rating"), "count": result.get("user_ratings_total"), "link": GOOGLE_MAPS_LINK}
+
+def _refresh_google_rating():
+    # One refresher across all workers: whoever holds the lock file fetches,
+    # everyone else keeps serving what they have and picks up the new file by mtime.
+    lock = None
     try:
-        payload["_ts"] = time.time()
-        with open(GOOGLE_CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(payload, f)
+        lock = try_lock_file(GOOGLE_CACHE_LOCK_FILE)
+        if lock is None:
+            with _google_lock:
+                _google_refresh["retry_at"] = time.time() + 1
+                _google_refresh["running"] = False
+            return False
+        if not _google_cache_fresh(_load_google_cache()):   # another worker may have just done it
+            if not _google_breaker.allow():
+                with _google_lock:
+                    _google_refresh["running"] = False
+                return False
+            _save_google_cache(_fetch_google_live())
+            _google_breaker.success()
     except Exception:
-        pass
-
+        _google_breaker.failure()
+        with _google_lock:
+            _google_refresh["running"] = False
+        return False
+    finally:
+        if lock is not None:
+            unlock_file(lock)
+    with _google_lock:
+        _google_refresh.update(running=False, retry_at=0.0)
+    return True
+
+def refresh_google_rating_async():
+    """Start a background refresh unless one is already running, another worker has it, or the breaker is backing off."""
+    with _google_lock:
+        if (_google_refresh["running"] or time.time() < _google_refresh["retry_at"]
+                or _google_breaker.waiting()):
+            return False
+        _google_refresh["running"] = True
+    threading.Thread(target=_refresh_google_rating, name="google-rating-refresh", daemon=True).start()
+    return True
+
+@metrics.timed("rating")
 def fetch_google_rating():
     """
     Returns dict like: {"rating": 4.9, "count": 27, "link": "..."} or None if not available.
-    Uses JSON cache for speed/reliability. Safe fallback if no API key.
+    Never blocks on the network; safe fallback if no API key.
     """
     # If no API key, show only link if provided.
     if not GOOGLE_PLACES_API_KEY:
@@ -85,8 +306,9 @@ def fetch_google_rating():
             return {"rating": None, "count": None, "link": GOOGLE_MAPS_LINK}
         return None
 
-    # Try cache first
     cached = _load_google_cache()
+    if not _google_cache_fresh(cached):
+        refresh_google_rating_async()
     if cached:
         return {
             "rating": cached.get("rating"),
@@ -94,27 +316,134 @@ def fetch_google_rating():
             "link": cached.get("link") or GOOGLE_MAPS_LINK
         }
 
-    # Fetch live (Place Details: rating + user_ratings_total)
-    try:
-        params = {
-            "place_id": GOOGLE_PLACE_ID,
-            "fields": "rating,user_ratings_total",
-            "key": GOOGLE_PLACES_API_KEY
-        }
-        url = "https://maps.googleapis.com/maps/api/place/details/json?" + urlencode(params)
-        with urlreq.urlopen(url, timeout=8) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-        result = data.get("result", {}) if isinstance(data, dict) else {}
-        rating = result.get("rating")
-        count = result.get("user_ratings_total")
-        payload = {"rating": rating, "count": count, "link": GOOGLE_MAPS_LINK}
-        _save_google_cache(payload)
-        return payload
-    except Exception:
-        # On any error, fall back to link only (if any)
-        if GOOGLE_MAPS_LINK:
-            return {"rating": None, "count": None, "link": GOOGLE_MAPS_LINK}
-        return None
+    # Nothing cached yet: link only (if any) until the refresh lands
+    if GOOGLE_MAPS_LINK:
+        return {"rating": None, "count": None, "link": GOOGLE_MAPS_LINK}
+    return None
+
+# -------- Site stylesheet + script (served as hashed assets, see build_assets) --------
+SITE_CSS = """
+:root{--teal:#7bc4d4;--pink:#f4a9c4;--ink:#263238;--bg:#f3fafc;--softgray:#8a9aa5;--green:#16c172}
+*{box-sizing:border-box}
+body{margin:0;font-family:-apple-system,system-ui,Arial;color:var(--ink);background:var(--bg);-webkit-font-smoothing:antialiased; -moz-osx-font-smoothing:grayscale}
+
+header{
+  text-align:center;
+  padding:1.2rem 0 .8rem;
+  border-bottom:1px solid #e9eef1;
+  background:linear-gradient(135deg, #fde4ec, #e0f7fa 70%, #ffffff);
+  position: sticky;
+  top: 0;
+  z-index: 10000;
+  -webkit-transform: translateZ(0);
+}
+
+.brand-logo{
+  display:block;margin:0 auto .5rem;
+  width:min(200px, 45vw);
+  height:auto;
+  border-radius:12px;
+  object-fit:contain;
+  background:#fff;
+  padding:8px;
+  box-shadow:0 4px 10px rgba(0,0,0,0.12);
+}
+
+.nav-centered{
+  display:flex;justify-content:center;flex-wrap:wrap;gap:.5rem;margin-top:.5rem;
+  position: relative;
+  z-index: 10001;
+  pointer-events: auto;
+}
+.nav-centered a{
+  color:var(--ink);text-decoration:none;padding:.55rem .9rem;border-radius:10px;font-weight:500;
+  -webkit-tap-highlight-color: transparent;
+}
+.nav-centered a.active, .nav-centered a:hover{background:#eef7fa;color:var(--teal);}
+
+.wrap{max-width:920px;margin:1rem auto;padding:0 1rem}
+
+.hero{
+  background:linear-gradient(180deg,#e9f7fb,#ffffff);
+  padding:1.2rem 1rem;border-radius:14px;
+  box-shadow:0 6px 22px rgba(20,30,40,.05);
+  position: relative;
+  z-index: 1;
+}
+
+.tour-box{
+  display:inline-block;text-decoration:none;color:var(--ink);background:#fff;border-radius:10px;
+  padding:.95rem 1.25rem;margin-top:1.0rem;box-shadow:0 4px 14px rgba(0,0,0,.08);
+  transition:transform .15s ease, box-shadow .15s ease;
+  border:1px solid #e8eef2;
+}
+.tour-box:hover{transform:translateY(-2px);box-shadow:0 10px 24px rgba(0,0,0,.10)}
+
+h1,h2{color:var(--teal);margin:.2rem 0 .6rem}
+.card{background:#fff;padding:1rem;border-radius:12px;box-shadow:0 6px 18px rgba(20,30,40,.06);margin:.9rem 0;transition:transform .15s ease, box-shadow .15s ease}
+.card:hover{transform:translateY(-2px);box-shadow:0 10px 24px rgba(20,30,40,.10)}
+.btn{display:inline-block;background:var(--pink);color:#fff;padding:.6rem 1rem;border-radius:10px;text-decoration:none}
+.btn:hover{transform:translateY(-1px); box-shadow:0 6px 16px rgba(0,0,0,.12)}
+.grid{display:grid;gap:1rem}
+@media(min-width:700px){.grid-2{grid-template-columns:1fr 1fr}}
+.muted{opacity:.85}
+
+.foot{padding:1.2rem 1rem;color:var(--teal);text-align:center}
+.foot-row{display:flex;gap:.5rem;align-items:center;justify-content:center;flex-wrap:wrap}
+.foot-ver{display:inline-flex;align-items:center;gap:.45rem;color:var(--softgray);font-weight:500}
+.dot{display:inline-block;width:.65rem;height:.65rem;border-radius:50%;background:var(--green);box-shadow:0 0 10px rgba(22,193,114,.6);}
+
+.alert{background:#e6fff1;border:1px solid #b6f0cd;color:#225a36;padding:.6rem .8rem;border-radius:10px;margin:.6rem 0}
+label{display:block;margin:.5rem 0 .25rem}
+input,textarea,select{width:100%;padding:.7rem .8rem;border:1px solid #d7e3ea;border-radius:10px}
+
+table{width:100%;border-collapse:collapse;background:#fff;border-radius:12px;overflow:hidden;box-shadow:0 6px 18px rgba(20,30,40,.06)}
+th,td{padding:.7rem .8rem;border-bottom:1px solid #eef2f5;vertical-align:top}
+th{background:#f8fbfd;color:#4a6572;text-align:left}
+tr:last-child td{border-bottom:none}
+.admin-actions{display:flex;gap:.5rem;flex-wrap:wrap;margin:.6rem 0}
+.muted-small{opacity:.7;font-size:.9rem}
+.stars{font-size:1.1rem;color:#f6b800}
+
+.g-badge{display:inline-flex;align-items:center;gap:.5rem;background:#fff;border:1px solid #e8eef2;border-radius:999px;padding:.35rem .6rem;margin-top:.6rem;box-shadow:0 2px 8px rgba(0,0,0,.06)}
+.g-chip{display:inline-flex;align-items:center;gap:.35rem}
+.g-logo{width:18px;height:18px;display:inline-block;background:
+  conic-gradient(from 45deg,#4285F4 0 25%,#34A853 0 50%,#FBBC05 0 75%,#EA4335 0 100%);
+  -webkit-mask: radial-gradient(circle at 50% 50%, transparent 6px, #000 7px);
+  mask: radial-gradient(circle at 50% 50%, transparent 6px, #000 7px);
+  border-radius:50%;
+}
+.g-num{font-weight:700}
+.g-link{color:var(--teal);text-decoration:none}
+"""
+
+# iOS tap helper: make header links AND buttons always navigate
+SITE_JS = """
+(function () {
+  function handleTap(e) {
+    var a = e.target.closest && e.target.closest('a[data-nav], a[data-go], a.btn');
+    if (!a || !a.href) return;
+
+    var href = a.getAttribute('href') || '';
+    if (!href || href === '#') return;
+
+    // Let iPhone handle phone/email links natively
+    if (href.indexOf('tel:') === 0 || href.indexOf('mailto:') === 0) {
+      return; // no preventDefault for tel/mailto
+    }
+
+    // For normal links, do a safe navigate
+    e.preventDefault();
+    if (document.activeElement && typeof document.activeElement.blur === 'function') {
+      document.activeElement.blur();
+    }
+    setTimeout(function () { window.location.href = href; }, 40);
+  }
+
+  document.addEventListener('touchend', handleTap, { passive: false });
+  document.addEventListener('click',    handleTap, { passive: false });
+})();
+"""
 
 # -------- Base HTML (unchanged except using google + version) --------
 BASE = """
@@ -124,106 +453,16 @@ BASE = """
 <head>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width,initial-scale=1,viewport-fit=cover">
-  <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate" />
-  <meta http-equiv="Pragma" content="no-cache" />
-  <meta http-equiv="Expires" content="0" />
   <title>{{ title }} · {{ brand }}</title>
   <meta name="description" content="Little Z’s Playhouse Daycare in Farmingdale, NY. Licensed care for ages 6 weeks–5 years. Healthy meals, safe backyard play, and loving, family-style learning. Book a tour.">
-  <style>
-    :root{--teal:#7bc4d4;--pink:#f4a9c4;--ink:#263238;--bg:#f3fafc;--softgray:#8a9aa5;--green:#16c172}
-    *{box-sizing:border-box}
-    body{margin:0;font-family:-apple-system,system-ui,Arial;color:var(--ink);background:var(--bg);-webkit-font-smoothing:antialiased; -moz-osx-font-smoothing:grayscale}
-
-    header{
-      text-align:center;
-      padding:1.2rem 0 .8rem;
-      border-bottom:1px solid #e9eef1;
-      background:linear-gradient(135deg, #fde4ec, #e0f7fa 70%, #ffffff);
-      position: sticky;
-      top: 0;
-      z-index: 10000;
-      -webkit-transform: translateZ(0);
-    }
-
-    .brand-logo{
-      display:block;margin:0 auto .5rem;
-      width:min(200px, 45vw);
-      height:auto;
-      border-radius:12px;
-      object-fit:contain;
-      background:#fff;
-      padding:8px;
-      box-shadow:0 4px 10px rgba(0,0,0,0.12);
-    }
-
-    .nav-centered{
-      display:flex;justify-content:center;flex-wrap:wrap;gap:.5rem;margin-top:.5rem;
-      position: relative;
-      z-index: 10001;
-      pointer-events: auto;
-    }
-    .nav-centered a{
-      color:var(--ink);text-decoration:none;padding:.55rem .9rem;border-radius:10px;font-weight:500;
-      -webkit-tap-highlight-color: transparent;
-    }
-    .nav-centered a.active, .nav-centered a:hover{background:#eef7fa;color:var(--teal);}
-
-    .wrap{max-width:920px;margin:1rem auto;padding:0 1rem}
-
-    .hero{
-      background:linear-gradient(180deg,#e9f7fb,#ffffff);
-      padding:1.2rem 1rem;border-radius:14px;
-      box-shadow:0 6px 22px rgba(20,30,40,.05);
-      position: relative;
-      z-index: 1;
-    }
-
-    .tour-box{
-      display:inline-block;text-decoration:none;color:var(--ink);background:#fff;border-radius:10px;
-      padding:.95rem 1.25rem;margin-top:1.0rem;box-shadow:0 4px 14px rgba(0,0,0,.08);
-      transition:transform .15s ease, box-shadow .15s ease;
-      border:1px solid #e8eef2;
-    }
-    .tour-box:hover{transform:translateY(-2px);box-shadow:0 10px 24px rgba(0,0,0,.10)}
-
-    h1,h2{color:var(--teal);margin:.2rem 0 .6rem}
-    .card{background:#fff;padding:1rem;border-radius:12px;box-shadow:0 6px 18px rgba(20,30,40,.06);margin:.9rem 0;transition:transform .15s ease, box-shadow .15s ease}
-    .card:hover{transform:translateY(-2px);box-shadow:0 10px 24px rgba(20,30,40,.10)}
-    .btn{display:inline-block;background:var(--pink);color:#fff;padding:.6rem 1rem;border-radius:10px;text-decoration:none}
-    .btn:hover{transform:translateY(-1px); box-shadow:0 6px 16px rgba(0,0,0,.12)}
-    .grid{display:grid;gap:1rem}
-    @media(min-width:700px){.grid-2{grid-template-columns:1fr 1fr}}
-    .muted{opacity:.85}
-
-    .foot{padding:1.2rem 1rem;color:var(--teal);text-align:center}
-    .foot-row{display:flex;gap:.5rem;align-items:center;justify-content:center;flex-wrap:wrap}
-    .foot-ver{display:inline-flex;align-items:center;gap:.45rem;color:var(--softgray);font-weight:500}
-    .dot{display:inline-block;width:.65rem;height:.65rem;border-radius:50%;background:var(--green);box-shadow:0 0 10px rgba(22,193,114,.6);}
-
-    .alert{background:#e6fff1;border:1px solid #b6f0cd;color:#225a36;padding:.6rem .8rem;border-radius:10px;margin:.6rem 0}
-    label{display:block;margin:.5rem 0 .25rem}
-    input,textarea,select{width:100%;padding:.7rem .8rem;border:1px solid #d7e3ea;border-radius:10px}
-
-    table{width:100%;border-collapse:collapse;background:#fff;border-radius:12px;overflow:hidden;box-shadow:0 6px 18px rgba(20,30,40,.06)}
-    th,td{padding:.7rem .8rem;border-bottom:1px solid #eef2f5;vertical-align:top}
-    th{background:#f8fbfd;color:#4a6572;text-align:left}
-    tr:last-child td{border-bottom:none}
-    .admin-actions{display:flex;gap:.5rem;flex-wrap:wrap;margin:.6rem 0}
-    .muted-small{opacity:.7;font-size:.9rem}
-    .stars{font-size:1.1rem;color:#f6b800}
-
-    .g-badge{display:inline-flex;align-items:center;gap:.5rem;background:#fff;border:1px solid #e8eef2;border-radius:999px;padding:.35rem .6rem;margin-top:.6rem;box-shadow:0 2px 8px rgba(0,0,0,.06)}
-    .g-chip{display:inline-flex;align-items:center;gap:.35rem}
-    .g-logo{width:18px;height:18px;display:inline-block;background:
-      conic-gradient(from 45deg,#4285F4 0 25%,#34A853 0 50%,#FBBC05 0 75%,#EA4335 0 100%);
-      -webkit-mask: radial-gradient(circle at 50% 50%, transparent 6px, #000 7px);
-      mask: radial-gradient(circle at 50% 50%, transparent 6px, #000 7px);
-      border-radius:50%;
-    }
-    .g-num{font-weight:700}
-    .g-link{color:var(--teal);text-decoration:none}
-  </style>
-  {% if logo %}<link rel="icon" href="{{ logo }}" type="image/png">{% endif %}
+  {% if critical_css %}
+  <style>{{ critical_css|safe }}</style>
+  <link rel="preload" href="{{ css }}" as="style" onload="this.onload=null;this.rel='stylesheet'">
+  <noscript><link rel="stylesheet" href="{{ css }}"></noscript>
+  {% else %}
+  <link rel="stylesheet" href="{{ css }}">
+  {% endif %}
+  {% if logo %}<link rel="icon" href="{{ logo }}" type="{{ logo_mime }}">{% endif %}
 
   {% if google and google.rating %}
   <script type="application/ld+json">
@@ -270,6 +509,13 @@ BASE = """
         {% endif %}
       </div>
     {% endif %}
+    {% if ratings and ratings.count %}
+      <div class="g-badge" aria-label="Ratings from our families">
+        <span class="g-chip"><span class="g-num">{{ '%.1f'|format(ratings.average) }}</span>★</span>
+        <span class="muted">({{ ratings.count }} {{ 'family' if ratings.count == 1 else 'families' }})</span>
+        <a class="g-link" href="{{ url_for('testimonials') }}">Testimonials</a>
+      </div>
+    {% endif %}
   </header>
 
   <main class="wrap">
@@ -288,59 +534,353 @@ BASE = """
     </div>
   </footer>
 
-  <!-- iOS tap helper: make header links AND buttons always navigate -->
-  <script>
-  (function () {
-    function handleTap(e) {
-      var a = e.target.closest && e.target.closest('a[data-nav], a[data-go], a.btn');
-      if (!a || !a.href) return;
-
-      var href = a.getAttribute('href') || '';
-      if (!href || href === '#') return;
-
-      // Let iPhone handle phone/email links natively
-      if (href.indexOf('tel:') === 0 || href.indexOf('mailto:') === 0) {
-        return; // no preventDefault for tel/mailto
-      }
-
-      // For normal links, do a safe navigate
-      e.preventDefault();
-      if (document.activeElement && typeof document.activeElement.blur === 'function') {
-        document.activeElement.blur();
-      }
-      setTimeout(function () { window.location.href = href; }, 40);
-    }
-
-    document.addEventListener('touchend', handleTap, { passive: false });
-    document.addEventListener('click',    handleTap, { passive: false });
-  })();
-  </script>
+  <script src="{{ js }}" defer></script>
 </body>
 </html>
 """
+
+# -------- Template registry --------
+# BASE and the page bodies are compiled once into jinja2.Template objects and
+# reused. PRECOMPILE_TEMPLATES=0 compiles on every call instead (handy while editing).
+PRECOMPILE_TEMPLATES = os.getenv("PRECOMPILE_TEMPLATES", "1") != "0"
+TEMPLATES = {}   # name -> source
+_compiled = {}   # name -> jinja2.Template
+
+def register_template(name, source):
+    TEMPLATES[name] = source
+    _compiled.pop(name, None)
+    return source
+
+def get_template(name):
+    tmpl = _compiled.get(name) if PRECOMPILE_TEMPLATES else None
+    if tmpl is None:
+        tmpl = app.jinja_env.from_string(TEMPLATES[name])
+        if PRECOMPILE_TEMPLATES:
+            _compiled[name] = tmpl
+    return tmpl
+
+def compile_templates():
+    for name in TEMPLATES:
+        get_template(name)
+
+render_template_timed = metrics.timed("template", render_template)
+
+def render_body(name, **context):
+    """Render a registered page body (no BASE around it)."""
+    return render_template_timed(get_template(name), **context)
+
+register_template("base", BASE)
+
+def feedback_ratings():
+    """Our own families' ratings: {"count", "average", "histogram"}; kept current as feedback changes."""
+    return feedback_store.ratings(wait=False)
+
 def render(page, title, body):
     # pull Google rating each render (fast via cache; safe fallback if no key)
     google = fetch_google_rating()
-    return render_template_string(
-        BASE,
+    logo = logo_asset()
+    return render_template_timed(
+        get_template("base"),
         page=page, title=title, body=body,
-        logo=logo_data_url(),
+        logo=logo_url(logo),
+        logo_mime=logo["mime"] if logo else None,
+        css=asset_url("css"), js=asset_url("js"), critical_css=site_assets()["critical"],
         google=google,
+        ratings=feedback_ratings(),
         version=VERSION
     )
 
-# -------- No-cache for every response (prevents freeze from stale caches) --------
+# -------- Rendered-page cache (public GET pages) --------
+# Public pages only change when the rating payload, VERSION or the logo change,
+# so their full HTML is kept in a small per-process LRU keyed on those.
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "64"))
+PAGE_CACHE_TTL_SECONDS = int(os.getenv("PAGE_CACHE_TTL_SECONDS", "300"))
+
+class PageCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, html)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, html):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, html)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "pid": os.getpid(), "size": len(self._data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+page_cache = PageCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL_SECONDS)
+
+def page_fingerprint():
+    """Everything besides the page itself that ends up in a public page's HTML."""
+    logo = logo_asset()
+    parts = [
+        json.dumps(fetch_google_rating(), sort_keys=True),
+        json.dumps(feedback_ratings(), sort_keys=True),
+        VERSION,
+        logo["digest"] if logo else "",
+        request.script_root,
+    ]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def has_flashes():
+    # only touch the session when there is a cookie, so anonymous hits stay Vary-free
+    if app.config["SESSION_COOKIE_NAME"] not in request.cookies:
+        return False
+    return bool(session.get("_flashes"))
+
+def cached_page(view):
+    """Serve GETs of a public page from page_cache; flash-bearing responses bypass it."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if PAGE_CACHE_SIZE <= 0 or request.method != "GET" or has_flashes():
+            return view(*args, **kwargs)
+        key = (request.endpoint, page_fingerprint())
+        html = page_cache.get(key)
+        if html is not None:
+            resp = make_response(html)
+            resp.headers["X-Page-Cache"] = "HIT"
+            return resp
+        resp = make_response(view(*args, **kwargs))
+        if resp.status_code == 200:
+            page_cache.set(key, resp.get_data(as_text=True))
+        resp.headers["X-Page-Cache"] = "MISS"
+        return resp
+    return wrapper
+
+# -------- Caching policy (per route) --------
+# Routes opt into a named policy with @cache_policy; anything else (admin,
+# form POSTs, redirects, errors, responses that consumed a flash) is private.
+PUBLIC_MAX_AGE_SECONDS = int(os.getenv("PUBLIC_MAX_AGE_SECONDS", "60"))
+PUBLIC_SWR_SECONDS = int(os.getenv("PUBLIC_SWR_SECONDS", "600"))
+
+CACHE_POLICIES = {
+    "private": "private, no-store",
+    "public": f"public, max-age={PUBLIC_MAX_AGE_SECONDS}, stale-while-revalidate={PUBLIC_SWR_SECONDS}",
+    "immutable": "public, max-age=31536000, immutable",
+}
+_route_policies = {}   # endpoint -> policy name
+
+def cache_policy(name):
+    def deco(view):
+        _route_policies[view.__name__] = name
+        return view
+    return deco
+
+def response_policy(resp):
+    policy = _route_policies.get(request.endpoint, "private")
+    if policy != "private" and (
+        request.method not in ("GET", "HEAD")
+        or resp.status_code not in (200, 304)
+        or session.modified
+    ):
+        policy = "private"
+    return policy
+
 @app.after_request
-def add_no_cache_headers(resp):
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    resp.headers["Pragma"] = "no-cache"
-    resp.headers["Expires"] = "0"
+def apply_cache_policy(resp):
+    policy = response_policy(resp)
+    resp.headers["Cache-Control"] = CACHE_POLICIES[policy]
+    if policy == "private":
+        resp.headers["Pragma"] = "no-cache"
+        resp.headers["Expires"] = "0"
+        return resp
+    if resp.status_code == 200 and not resp.is_streamed:
+        if resp.get_etag() == (None, None):
+            # strong ETag from the rendered body, so revalidation is a 304
+            resp.set_etag(hashlib.sha256(resp.get_data()).hexdigest()[:32])
+        resp.make_conditional(request)
     return resp
 
+# -------- Response compression --------
+# Text bodies over COMPRESS_MIN_BYTES are sent br (if the brotli module is
+# installed) or gzip, whichever the client prefers. Public pages are compressed
+# once at the highest level and the bytes reused, keyed on the body's hash.
+# Admin and /metrics responses are never compressed (they mix secrets with
+# request input, the BREACH setup). Registered after apply_cache_policy so it
+# runs first: the ETag it sets is per encoding.
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "1") != "0"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "500"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))   # gzip level for uncached bodies
+COMPRESS_CACHE_SIZE = int(os.getenv("COMPRESS_CACHE_SIZE", "128"))
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+compressed_cache = PageCache(COMPRESS_CACHE_SIZE, PAGE_CACHE_TTL_SECONDS)
+
+def negotiate_encoding(header):
+    """'br', 'gzip' or None for an Accept-Encoding header value."""
+    prefs = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        prefs[name.strip().lower()] = q
+    wildcard = prefs.get("*", 0.0)
+    for enc in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if prefs.get(enc, wildcard) > 0:
+            return enc
+    return None
+
+def compress_bytes(data, encoding, best=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    c = zlib.compressobj(9 if best else COMPRESS_LEVEL, zlib.DEFLATED, 31)   # wbits 31: gzip framing
+    return c.compress(data) + c.flush()
+
+@app.after_request
+def compress_response(resp):
+    if (not COMPRESS_ENABLED or resp.is_streamed or resp.status_code != 200
+            or "Content-Encoding" in resp.headers
+            or request.path.startswith(("/admin", "/metrics"))
+            or not resp.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return resp
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return resp
+    if response_policy(resp) == "private":
+        body = compress_bytes(data, encoding)
+    else:
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        key = (digest, encoding)
+        body = compressed_cache.get(key)
+        if body is None:
+            body = compress_bytes(data, encoding, best=True)
+            compressed_cache.set(key, body)
+        resp.set_etag(f"{digest}-{encoding}")
+    resp.set_data(body)
+    resp.headers["Content-Encoding"] = encoding
+    return resp
+
+# -------- Logo asset (hashed URL, immutable) --------
+@app.route("/assets/logo-<digest>.<ext>")
+@cache_policy("immutable")
+def logo_file(digest, ext):
+    logo = logo_asset()
+    if not logo:
+        abort(404)
+    if digest != logo["digest"]:
+        # old hash after the logo changed: send them to the current one
+        return redirect(logo_url())
+    resp = make_response(logo["data"])
+    resp.mimetype = logo["mime"]
+    resp.set_etag(logo["digest"])
+    return resp.make_conditional(request)
+
+# -------- Site CSS/JS assets (minified, hashed URL, immutable) --------
+# Built once, on first use (or by warm_up()), from SITE_CSS / SITE_JS. CRITICAL_CSS=1 also inlines
+# the rules for the header and hero (first paint) and loads the rest async.
+CRITICAL_CSS = os.getenv("CRITICAL_CSS", "0") == "1"
+CRITICAL_SELECTORS = (":root", "*", "body", "header", ".brand-logo", ".nav-centered", ".wrap", ".hero", "h1", "h2")
+ASSETS = {}   # ext -> {"data", "digest", "mime"}
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{}:;,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+def minify_js(js):
+    """Conservative: drop comments and indentation but keep line breaks (no ASI surprises)."""
+    out = []
+    for line in js.splitlines():
+        line = re.sub(r"(^|\s)//[^'\"]*$", "", line).strip()
+        if line:
+            out.append(line)
+    return "\n".join(out)
+
+def css_rules(css):
+    """Top-level (selector, block) pairs of minified CSS; @media blocks come back whole."""
+    rules, depth, start = [], 0, 0
+    for i, ch in enumerate(css):
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                head = css[start:css.index("{", start)]
+                rules.append((head, css[start:i + 1]))
+                start = i + 1
+    return rules
+
+def critical_css(css):
+    keep = []
+    for head, block in css_rules(css):
+        if head.startswith("@"):
+            continue
+        for sel in head.split(","):
+            first = sel.split(" ")[0]
+            if not first.startswith(":"):
+                first = first.split(":")[0]   # a:hover -> a, but keep :root
+            if first in CRITICAL_SELECTORS:
+                keep.append(block)
+                break
+    return "".join(keep)
+
+def build_assets():
+    for ext, mime, data in (("css", "text/css", minify_css(SITE_CSS)), ("js", "application/javascript", minify_js(SITE_JS))):
+        raw = data.encode("utf-8")
+        ASSETS[ext] = {"data": raw, "mime": mime, "digest": hashlib.sha256(raw).hexdigest()[:16]}
+    ASSETS["critical"] = critical_css(ASSETS["css"]["data"].decode("utf-8")) if CRITICAL_CSS else ""
+    return ASSETS
+
+def site_assets():
+    return ASSETS if "critical" in ASSETS else build_assets()
+
+def asset_url(ext):
+    return url_for("site_asset", digest=site_assets()[ext]["digest"], ext=ext)
+
+@app.route("/assets/site-<digest>.<ext>")
+@cache_policy("immutable")
+def site_asset(digest, ext):
+    asset = site_assets().get(ext) if ext in ("css", "js") else None
+    if asset is None:
+        abort(404)
+    if digest != asset["digest"]:
+        return redirect(asset_url(ext))
+    resp = make_response(asset["data"])
+    resp.mimetype = asset["mime"]
+    resp.set_etag(asset["digest"])
+    return resp.make_conditional(request)
+
 # -------- Public Pages --------
-@app.route("/")
-def home():
-    body = """
+register_template("home", """
     <section class="hero" style="text-align:center;padding:2rem 1rem;">
       <h1 style="font-size:2rem;color:var(--teal);margin-bottom:.5rem;">
         Welcome to Little Z’s Playhouse Daycare 🌈
@@ -374,23 +914,29 @@ def home():
         <p class="muted">Outdoor time in our dedicated, supervised play area.</p>
       </a>
     </div>
-    """
-    return render("home", "Home", body)
+    """)
 
-@app.route("/about")
-def about():
-    body = """
+@app.route("/")
+@cache_policy("public")
+@cached_page
+def home():
+    return render("home", "Home", render_body("home"))
+
+register_template("about", """
     <h1>About Us</h1>
     <div class="card">
       <p>We’re a licensed, family-style daycare in Farmingdale. Children learn through play, stories, music, and hands-on activities.</p>
       <p><strong>Spanish-friendly:</strong> We naturally introduce simple Spanish words and songs during the day.</p>
     </div>
-    """
-    return render("about", "About", body)
+    """)
 
-@app.route("/programs")
-def programs():
-    body = """
+@app.route("/about")
+@cache_policy("public")
+@cached_page
+def about():
+    return render("about", "About", render_body("about"))
+
+register_template("programs", """
     <h1>Programs</h1>
     <div class="grid grid-2">
       <div class="card"><h2>Infants (6w–12m)</h2><p>Warm, responsive care with tummy time and sensory play.</p></div>
@@ -398,29 +944,73 @@ def programs():
       <div class="card"><h2>Preschool (3–5y)</h2><p>Pre-K readiness: letters, numbers, crafts, social-emotional learning.</p></div>
       <div class="card"><h2>Schedules</h2><p>Full-time & limited part-time. Ask about early drop-off/late pick-up.</p></div>
     </div>
-    """
-    return render("programs", "Programs", body)
+    """)
 
-# -------- Contact (with working honeypot) --------
-@app.route("/contact", methods=["GET", "POST"])
-def contact():
-    if request.method == "POST":
-        # Honeypot: real users won't fill this hidden field
-        if request.form.get("website"):
-            return redirect(url_for("thanks"))
-
-        row = [
-            datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds"),
-            request.form.get("name", "").strip(),
-            request.form.get("email", "").strip(),
-            request.form.get("phone", "").strip(),
-            request.form.get("message", "").strip(),
-        ]
-        with open(CSV_FILE, "a", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(row)
-        return redirect(url_for("thanks"))
+@app.route("/programs")
+@cache_policy("public")
+@cached_page
+def programs():
+    return render("programs", "Programs", render_body("programs"))
+
+# -------- Rate limiting (form POSTs) --------
+# Token bucket per (form, client IP), checked before the form is parsed or
+# anything touches storage, so a flood costs a dict lookup and a short 429.
+# Set RATE_LIMIT_SHARED_FILE to share buckets across gunicorn workers.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "3"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_KEYS = int(os.getenv("RATE_LIMIT_KEYS", "10000"))
+RATE_LIMIT_SHARED_FILE = os.getenv("RATE_LIMIT_SHARED_FILE", "").strip()
+# Proxies in front of gunicorn that append to X-Forwarded-For: 1 behind the
+# Heroku router (or one nginx), 0 when clients connect directly. The client is
+# the entry that many hops from the right; entries further left are whatever
+# the client sent and are never trusted. Unset, it is 1 on a Heroku dyno (DYNO
+# is set there) and 0 elsewhere; with 0 behind a proxy every client shares the
+# proxy's bucket. The older RATE_LIMIT_TRUST_PROXY is read when it is unset and
+# may be a count or a boolean (true/yes/on = 1).
+def _proxy_hops():
+    raw = os.getenv("RATE_LIMIT_PROXY_HOPS", os.getenv("RATE_LIMIT_TRUST_PROXY", "")).strip().lower()
+    if not raw:
+        return 1 if os.getenv("DYNO") else 0
+    if raw in ("true", "yes", "on", "false", "no", "off"):
+        return int(raw in ("true", "yes", "on"))
+    try:
+        hops = int(raw)
+    except ValueError:
+        hops = -1
+    if hops < 0:
+        raise ValueError(f"RATE_LIMIT_PROXY_HOPS must be a number of proxies (0, 1, ...), got {raw!r}")
+    return hops
+
+RATE_LIMIT_PROXY_HOPS = _proxy_hops()
+
+form_limiter = make_limiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST,
+                            RATE_LIMIT_KEYS, RATE_LIMIT_SHARED_FILE)
+
+def client_ip():
+    route = request.access_route   # X-Forwarded-For entries, or just remote_addr
+    if RATE_LIMIT_PROXY_HOPS > 0 and len(route) >= RATE_LIMIT_PROXY_HOPS:
+        return route[-RATE_LIMIT_PROXY_HOPS]
+    return request.remote_addr or ""
+
+def rate_limited(form):
+    """Reject POSTs over the per-client budget with a 429 before the view runs."""
+    def deco(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == "POST" and RATE_LIMIT_PER_MINUTE > 0:
+                ok, retry_after = form_limiter.take((form, client_ip()))
+                if not ok:
+                    return Response(
+                        "Too many submissions. Please wait a minute and try again.\n",
+                        status=429, mimetype="text/plain",
+                        headers={"Retry-After": str(int(retry_after) + 1)},
+                    )
+            return view(*args, **kwargs)
+        return wrapper
+    return deco
 
-    body = """
+# -------- Contact (with working honeypot) --------
+register_template("contact", """
 <h1>Contact Us or Book a Tour</h1>
 
 <div class="card" style="background:#f8fbfd;">
@@ -462,13 +1052,32 @@ def contact():
 <p class="muted" style="margin-top:0.5rem;">
   Submissions are securely stored in our system. You’ll receive a follow-up call or email within 1–2 business days.
 </p>
-"""
-    return render("contact", "Contact", body)
+""")
+
+@app.route("/contact", methods=["GET", "POST"])
+@cache_policy("public")
+@rate_limited("contact")
+@cached_page
+def contact():
+    if request.method == "POST":
+        # Honeypot: real users won't fill this hidden field
+        if request.form.get("website"):
+            return redirect(url_for("thanks"))
 
+        row = [
+            datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds"),
+            request.form.get("name", "").strip(),
+            request.form.get("email", "").strip(),
+            request.form.get("phone", "").strip(),
+            request.form.get("message", "").strip(),
+        ]
+        save_contact(row)
+        return redirect(url_for("thanks"))
 
-@app.route("/thanks")
-def thanks():
-    body = """
+    return render("contact", "Contact", render_body("contact"))
+
+
+register_template("thanks", """
     <section class="hero" style="text-align:center;padding:2rem 1rem;">
       <h1>Thank You! 🎉</h1>
       <p class="muted">We’ve received your message. We’ll reach out soon to confirm your tour or answer any questions.</p>
@@ -479,53 +1088,24 @@ def thanks():
         </a>
       </div>
     </section>
-    """
-    return render("thanks", "Thank You", body)
+    """)
+
+@app.route("/thanks")
+@cache_policy("public")
+@cached_page
+def thanks():
+    return render("thanks", "Thank You", render_body("thanks"))
 
 # -------- Feedback: Public --------
 def new_feedback_id():
-    return datetime.now().strftime("%Y%m%d%H%M%S%f")
+    # unique across workers and time-ordered; older rows keep their numeric ids
+    return new_record_id()
 
 def load_feedback():
-    rows = []
-    if os.path.exists(FEEDBACK_FILE):
-        with open(FEEDBACK_FILE, newline="", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            rows = list(r)
-    return rows
-
-def save_feedback(rows):
-    with open(FEEDBACK_FILE, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["id","timestamp","name","relationship","rating","comment","can_publish","approved"])
-        w.writeheader()
-        for row in rows:
-            w.writerow(row)
+    """All feedback records (storage.Feedback), oldest first."""
+    return feedback_store.rows()
 
-@app.route("/feedback", methods=["GET", "POST"])
-def feedback():
-    if request.method == "POST":
-        fid = new_feedback_id()
-        rating = request.form.get("rating","").strip()
-        try:
-            rating = str(max(1, min(5, int(rating))))
-        except:
-            rating = "5"
-        row = {
-            "id": fid,
-            "timestamp": datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds"),
-            "name": request.form.get("name","").strip(),
-            "relationship": request.form.get("relationship","Parent/Guardian").strip(),
-            "rating": rating,
-            "comment": request.form.get("comment","").strip(),
-            "can_publish": "yes" if request.form.get("can_publish") else "no",
-            "approved": "no"
-        }
-        rows = load_feedback()
-        rows.append(row)
-        save_feedback(rows)
-        flash("Thank you! Your feedback was received.")
-        return redirect(url_for("feedback"))
-    body = """
+register_template("feedback", """
     <h1>Leave Feedback</h1>
     <form method="post" class="card">
       <label>Name</label>
@@ -557,39 +1137,137 @@ def feedback():
 
       <div style="margin-top:.9rem"><button class="btn">Submit Feedback</button></div>
     </form>
-    """
-    return render("feedback", "Leave Feedback", body)
-
-@app.route("/testimonials")
-def testimonials():
-    rows = load_feedback()
-    approved = [r for r in rows if r.get("approved")=="yes" and r.get("can_publish")=="yes"]
-    approved.sort(key=lambda r: r.get("timestamp",""), reverse=True)
+    """)
 
-    cards = []
-    for r in approved:
+@app.route("/feedback", methods=["GET", "POST"])
+@cache_policy("public")
+@rate_limited("feedback")
+@cached_page
+def feedback():
+    if request.method == "POST":
+        fid = new_feedback_id()
+        rating = request.form.get("rating","").strip()
         try:
-            rating_int = int(r.get("rating","0") or 0)
+            rating = str(max(1, min(5, int(rating))))
         except:
-            rating_int = 0
-        stars = "★"*rating_int + "☆"*(5-rating_int)
-        cards.append(f"""
+            rating = "5"
+        row = {
+            "id": fid,
+            "timestamp": datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds"),
+            "name": request.form.get("name","").strip(),
+            "relationship": request.form.get("relationship","Parent/Guardian").strip(),
+            "rating": rating,
+            "comment": request.form.get("comment","").strip(),
+            "can_publish": "yes" if request.form.get("can_publish") else "no",
+            "approved": "no"
+        }
+        save_feedback(row)
+        flash("Thank you! Your feedback was received.")
+        return redirect(url_for("feedback"))
+    return render("feedback", "Leave Feedback", render_body("feedback"))
+
+# -------- Testimonials (materialized) --------
+def testimonial_card(r):
+    stars = "★"*r.rating + "☆"*(5-r.rating)
+    return f"""
           <div class="card">
             <div class="stars">{stars}</div>
-            <p style="margin:.4rem 0 0;">{r.get('comment','')}</p>
-            <div class="muted" style="margin-top:.4rem;">– {r.get('name','Anonymous')}, {r.get('relationship','Parent')}</div>
+            <p style="margin:.4rem 0 0;">{r.comment}</p>
+            <div class="muted" style="margin-top:.4rem;">– {r.name}, {r.relationship}</div>
           </div>
-        """)
-    body = f"""
+        """
+
+def ratings_card(summary):
+    """Average and a 5..1 star histogram for the top of the testimonials page."""
+    if not summary or not summary["count"]:
+        return ""
+    bars = "".join(f"""
+            <div style="display:flex;align-items:center;gap:.5rem;margin-top:.25rem;">
+              <span style="width:2.2rem;">{stars}★</span>
+              <span style="flex:1;background:#eef6f8;border-radius:4px;"><span style="display:block;height:.6rem;border-radius:4px;background:var(--teal);width:{100 * n // summary['count']}%;"></span></span>
+              <span class="muted" style="width:3rem;text-align:right;">{n}</span>
+            </div>""" for stars, n in reversed(list(enumerate(summary["histogram"], 1))))
+    return f"""
+          <div class="card">
+            <div class="stars">{summary['average']:.1f} ★ <span class="muted">· {summary['count']} rating{'s' if summary['count'] != 1 else ''}</span></div>
+            {bars}
+          </div>
+        """
+
+class TestimonialsView:
+    """
+    The testimonials body, kept current from store.changes(published=True): a
+    request only looks at the store's change counters, and when the approved +
+    publishable set did change (in any worker) only the cards that appeared
+    or went away are rendered or dropped before the body is joined again.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._order = []   # (-ts, id, timestamp), newest first
+        self._cards = {}   # (id, timestamp) -> card html
+        self._body = None
+        self.hits = self.rebuilds = 0
+
+    def body(self):
+        with self._lock:
+            self._cursor, full, records, gone = self.store.changes(self._cursor, published=True)
+            if self._body is not None and not (full or records or gone):
+                self.hits += 1
+                return self._body
+            self.rebuilds += 1
+            if full:   # first build, or the store started over: keep the card html we have
+                old, self._cards = self._cards, {}
+                self._order = sorted((-r.ts, r.id, r.timestamp) for r in records)
+                for r in records:
+                    key = (r.id, r.timestamp)
+                    self._cards[key] = old.get(key) or testimonial_card(r)
+            else:
+                for r in gone:
+                    self._drop(r)
+                for r in records:
+                    key = (r.id, r.timestamp)
+                    if key not in self._cards:
+                        bisect.insort(self._order, (-r.ts, r.id, r.timestamp))
+                        self._cards[key] = testimonial_card(r)
+            cards = self._cards
+            self._body = f"""
       <h1>Testimonials</h1>
-      {''.join(cards) if cards else '<div class="card">No testimonials yet. Be the first to <a href="'+url_for('feedback')+'">leave feedback</a>!</div>'}
+      {ratings_card(self.store.ratings())}
+      {''.join(cards[k[1:]] for k in self._order) if cards else '<div class="card">No testimonials yet. Be the first to <a href="'+url_for('feedback')+'">leave feedback</a>!</div>'}
     """
-    return render("testimonials", "Testimonials", body)
+            return self._body
+
+    def _drop(self, r):
+        if self._cards.pop((r.id, r.timestamp), None) is not None:
+            entry = (-r.ts, r.id, r.timestamp)
+            i = bisect.bisect_left(self._order, entry)
+            if i < len(self._order) and self._order[i] == entry:
+                del self._order[i]
+
+testimonials_view = None   # built by init_storage()
+
+@app.route("/testimonials")
+@cache_policy("public")
+def testimonials():
+    return render("testimonials", "Testimonials", testimonials_view.body())
 
 # -------- Admin (secure) --------
 def admin_required():
     return session.get("is_admin") is True
 
+register_template("admin_login", """
+    <h1>Admin Login</h1>
+    <form method="post" class="card" style="max-width:420px">
+      <label>Password</label>
+      <input name="password" type="password" required>
+      <div style="margin-top:.8rem"><button class="btn">Log In</button></div>
+    </form>
+    <p class="muted-small">Protected area — authorized staff only.</p>
+    """)
+
 @app.route("/admin/login", methods=["GET", "POST"])
 def admin_login():
     if request.method == "POST":
@@ -600,16 +1278,7 @@ def admin_login():
             dest = request.args.get("next") or url_for("admin_messages")
             return redirect(dest)
         flash("Incorrect password.")
-    body = """
-    <h1>Admin Login</h1>
-    <form method="post" class="card" style="max-width:420px">
-      <label>Password</label>
-      <input name="password" type="password" required>
-      <div style="margin-top:.8rem"><button class="btn">Log In</button></div>
-    </form>
-    <p class="muted-small">Protected area — authorized staff only.</p>
-    """
-    return render("admin", "Admin Login", body)
+    return render("admin", "Admin Login", render_body("admin_login"))
 
 @app.route("/admin/logout")
 def admin_logout():
@@ -617,28 +1286,18 @@ def admin_logout():
     flash("Logged out.")
     return redirect(url_for("admin_login"))
 
-@app.route("/admin/messages")
-def admin_messages():
-    if not admin_required():
-        return redirect(url_for("admin_login", next=request.path))
-
-    rows = []
-    if os.path.exists(CSV_FILE):
-        with open(CSV_FILE, newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            rows = list(reader)
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ROWS_SLOT = "<!--rows-->"
 
-    header = rows[0] if rows else ["timestamp","name","email","phone","message"]
-    data = rows[1:] if len(rows) > 1 else []
-
-    body = """
+register_template("admin_messages", """
     <div class="admin-actions">
       <a class="btn" href="{{ url_for('home') }}">⬅︎ Back to Site</a>
       <a class="btn" href="{{ url_for('admin_feedback') }}" style="background:var(--teal);">Feedback Reviews</a>
+      <a class="btn" href="{{ url_for('admin_search') }}" style="background:var(--teal);">Search</a>
       <a class="btn" href="{{ url_for('admin_logout') }}" style="background:#7bc4d4;">Logout</a>
     </div>
     <h1>Messages</h1>
-    {% if not data %}
+    {% if not total %}
       <div class="card">No submissions yet.</div>
     {% else %}
       <div class="card" style="overflow:auto;">
@@ -647,48 +1306,86 @@ def admin_messages():
             <tr>{% for h in header %}<th>{{ h }}</th>{% endfor %}</tr>
           </thead>
           <tbody>
+            {% if stream %}{{ rows_slot|safe }}{% else %}
             {% for row in data %}
               <tr>{% for col in row %}<td>{{ col }}</td>{% endfor %}</tr>
             {% endfor %}
+            {% endif %}
           </tbody>
         </table>
-        <div class="muted-small" style="margin-top:.6rem;">Total: {{ data|length }} messages</div>
+        <div class="muted-small" style="margin-top:.6rem;">
+          {% if stream %}Total: {{ total }} messages (newest first)
+          {% else %}Showing {{ data|length }} of {{ total }} messages (newest first){% endif %}
+        </div>
+        <div class="admin-actions">
+          {% if before is not none %}<a class="btn" href="{{ url_for('admin_messages') }}">Newest</a>{% endif %}
+          {% if next_cursor is not none %}<a class="btn" href="{{ url_for('admin_messages', before=next_cursor, limit=limit) }}">Older →</a>{% endif %}
+          {% if not stream %}<a class="btn" href="{{ url_for('admin_messages', all=1) }}" style="background:var(--teal);">Show all</a>{% endif %}
+          <a class="btn" href="{{ url_for('admin_messages_export') }}" style="background:var(--teal);">Export CSV</a>
+        </div>
       </div>
     {% endif %}
-    """
-    return render("admin", "Messages", render_template_string(body, header=header, data=data))
+    """)
+
+def _message_rows_html(rows, batch=500):
+    """<tr> markup for a stream of rows, yielded a batch at a time."""
+    out = []
+    for row in rows:
+        out.append("<tr>" + "".join(f"<td>{escape(col)}</td>" for col in row) + "</tr>\n")
+        if len(out) >= batch:
+            yield "".join(out)
+            out = []
+    if out:
+        yield "".join(out)
+
+@app.route("/admin/messages")
+def admin_messages():
+    if not admin_required():
+        return redirect(url_for("admin_login", next=request.path))
+
+    header = CONTACT_FIELDS
+    if request.args.get("all"):
+        # stream every row newest first; memory stays flat however big the log is
+        total = submissions.count()
+        body = render_body("admin_messages", header=header, total=total, stream=True,
+                           rows_slot=ROWS_SLOT, before=None, next_cursor=None)
+        head, _, tail = render("admin", "Messages", body).partition(ROWS_SLOT)
+        def generate():
+            yield head
+            yield from _message_rows_html(submissions.iter_newest())
+            yield tail
+        return Response(stream_with_context(generate()), mimetype="text/html")
+
+    before = request.args.get("before", type=int)
+    limit = max(1, min(500, request.args.get("limit", ADMIN_PAGE_SIZE, type=int)))
+    data, next_cursor, total = submissions.page(before, limit)
+    return render("admin", "Messages", render_body(
+        "admin_messages", header=header, data=data, total=total, stream=False,
+        before=before, next_cursor=next_cursor, limit=limit))
 
 @app.route("/admin/feedback", methods=["GET", "POST"])
 def admin_feedback():
     if not admin_required():
         return redirect(url_for("admin_login", next=request.path))
 
-    rows = load_feedback()
-
     if request.method == "POST":
         fid = request.form.get("id","")
         action = request.form.get("action","")
-        changed = False
-        for r in rows:
-            if r.get("id") == fid:
-                if action == "approve":
-                    r["approved"] = "yes"; changed = True
-                elif action == "unapprove":
-                    r["approved"] = "no"; changed = True
-                elif action == "delete":
-                    r["__delete__"] = True; changed = True
-                break
-        if changed:
-            rows = [r for r in rows if not r.get("__delete__")]
-            save_feedback(rows)
+        if action in MODERATION_ACTIONS and feedback_store.get(fid) is not None:
+            feedback_store.moderate(fid, action,
+                timestamp=datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds"))
             flash("Saved.")
         return redirect(url_for("admin_feedback"))
 
-    table_html = """
+    rows = load_feedback()
+
+    table_html = f"""
       <div class="admin-actions">
-        <a class="btn" href="{{ url_for('home') }}">⬅︎ Back to Site</a>
-        <a class="btn" href="{{ url_for('admin_messages') }}">Contact Messages</a>
-        <a class="btn" href="{{ url_for('admin_logout') }}" style="background:#7bc4d4;">Logout</a>
+        <a class="btn" href="{url_for('home')}">⬅︎ Back to Site</a>
+        <a class="btn" href="{url_for('admin_messages')}">Contact Messages</a>
+        <a class="btn" href="{url_for('admin_search', **{'in': 'feedback'})}" style="background:var(--teal);">Search</a>
+        <a class="btn" href="{url_for('admin_feedback_export')}" style="background:var(--teal);">Export CSV</a>
+        <a class="btn" href="{url_for('admin_logout')}" style="background:#7bc4d4;">Logout</a>
       </div>
       <h1>Feedback Reviews</h1>
     """
@@ -706,31 +1403,27 @@ def admin_feedback():
             <tbody>
         """
         for r in reversed(rows):
-            try:
-                ri = int(r.get("rating","0") or 0)
-            except:
-                ri = 0
-            stars = "★"*ri + "☆"*(5-ri)
+            stars = "★"*r.rating + "☆"*(5-r.rating)
             table_html += f"""
               <tr>
-                <td>{r.get('timestamp','')}</td>
-                <td>{r.get('name','')}</td>
-                <td>{r.get('relationship','')}</td>
+                <td>{r.timestamp}</td>
+                <td>{r.name}</td>
+                <td>{r.relationship}</td>
                 <td><span class="stars">{stars}</span></td>
-                <td>{r.get('comment','')}</td>
-                <td>{r.get('can_publish','no')}</td>
-                <td>{r.get('approved','no')}</td>
+                <td>{r.comment}</td>
+                <td>{r.get('can_publish')}</td>
+                <td>{r.get('approved')}</td>
                 <td>
                   <form method="post" style="display:inline;">
-                    <input type="hidden" name="id" value="{r.get('id','')}">
+                    <input type="hidden" name="id" value="{r.id}">
                     <button class="btn" name="action" value="approve">Approve</button>
                   </form>
                   <form method="post" style="display:inline;">
-                    <input type="hidden" name="id" value="{r.get('id','')}">
+                    <input type="hidden" name="id" value="{r.id}">
                     <button class="btn" name="action" value="unapprove">Unapprove</button>
                   </form>
                   <form method="post" style="display:inline;">
-                    <input type="hidden" name="id" value="{r.get('id','')}">
+                    <input type="hidden" name="id" value="{r.id}">
                     <button class="btn" name="action" value="delete">Delete</button>
                   </form>
                 </td>
@@ -743,9 +1436,303 @@ def admin_feedback():
         """
     return render("admin", "Feedback Reviews", table_html)
 
+# -------- Admin: search --------
+message_search = feedback_search = None   # built by init_storage()
+
+register_template("admin_search", """
+    <div class="admin-actions">
+      <a class="btn" href="{{ url_for('admin_messages') }}">Contact Messages</a>
+      <a class="btn" href="{{ url_for('admin_feedback') }}" style="background:var(--teal);">Feedback Reviews</a>
+      <a class="btn" href="{{ url_for('admin_logout') }}" style="background:#7bc4d4;">Logout</a>
+    </div>
+    <h1>Search</h1>
+    <form method="get" class="card">
+      <label>Search</label>
+      <input name="q" value="{{ q }}" placeholder="Name, email, phone or words from the message" autofocus>
+      <label>In</label>
+      <select name="in">
+        <option value="messages" {% if where=='messages' %}selected{% endif %}>Contact messages</option>
+        <option value="feedback" {% if where=='feedback' %}selected{% endif %}>Feedback</option>
+      </select>
+      {% if where == 'feedback' %}
+        <div class="grid grid-2">
+          <div><label>Rating</label><select name="rating"><option value="">Any</option>
+            {% for v in ['5','4','3','2','1'] %}<option {% if filters.rating==v %}selected{% endif %}>{{ v }}</option>{% endfor %}</select></div>
+          <div><label>Approved</label><select name="approved"><option value="">Any</option>
+            {% for v in ['yes','no'] %}<option {% if filters.approved==v %}selected{% endif %}>{{ v }}</option>{% endfor %}</select></div>
+          <div><label>Relationship</label><select name="relationship"><option value="">Any</option>
+            {% for v in ['Parent','Guardian','Relative','Other'] %}<option {% if filters.relationship==v %}selected{% endif %}>{{ v }}</option>{% endfor %}</select></div>
+        </div>
+      {% endif %}
+      <div style="margin-top:.8rem"><button class="btn">Search</button></div>
+    </form>
+    {% if searched %}
+      <div class="card" style="overflow:auto;">
+        {% if not results %}No matches.{% else %}
+        <table>
+          <thead><tr>{% for h in header %}<th>{{ h }}</th>{% endfor %}</tr></thead>
+          <tbody>
+            {% for r in results %}<tr>{% for h in header %}<td>{{ r.get(h, '') }}</td>{% endfor %}</tr>{% endfor %}
+          </tbody>
+        </table>
+        {% endif %}
+        <div class="muted-small" style="margin-top:.6rem;">{{ total }} match(es){% if total > results|length %}, showing the newest {{ results|length }}{% endif %}</div>
+      </div>
+    {% endif %}
+    """)
+
+@app.route("/admin/search")
+def admin_search():
+    if not admin_required():
+        return redirect(url_for("admin_login", next=request.path))
+    q = request.args.get("q", "").strip()
+    where = "feedback" if request.args.get("in") == "feedback" else "messages"
+    filters = {f: request.args.get(f) for f in FeedbackSearch.FACETS if request.args.get(f)} if where == "feedback" else {}
+    limit = max(1, min(500, request.args.get("limit", ADMIN_PAGE_SIZE, type=int)))
+    searched = bool(q or filters)
+    results, total = [], 0
+    if searched:
+        if where == "feedback":
+            results, total = feedback_search.search(q, filters, limit)
+        else:
+            results, total = message_search.search(q, limit)
+    if request.args.get("format") == "json":
+        return {"results": [r.to_row() if isinstance(r, Feedback) else r for r in results], "total": total}
+    header = FEEDBACK_FIELDS if where == "feedback" else CONTACT_FIELDS
+    return render("admin", "Search", render_body(
+        "admin_search", q=q, where=where, filters=filters, searched=searched,
+        results=results, total=total, header=header))
+
+# -------- Admin: streaming exports --------
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+class _Lines:
+    """Write target for csv.writer that just remembers the last line."""
+    def write(self, s):
+        self.line = s
+
+def _export_lines(header, rows, fmt):
+    if fmt == "ndjson":
+        for row in rows:
+            if not isinstance(row, (dict, Feedback)):
+                row = dict(zip(header, row))
+            yield json.dumps({k: row.get(k, "") for k in header}, ensure_ascii=False) + "\n"
+        return
+    out = _Lines()
+    w = csv.writer(out)
+    w.writerow(header)
+    yield out.line
+    for row in rows:
+        w.writerow([row.get(k, "") for k in header] if isinstance(row, (dict, Feedback)) else row)
+        yield out.line
+
+def _export_chunks(lines, gzip_it):
+    """Re-chunk lines into EXPORT_CHUNK_BYTES pieces, gzip'd on the fly if asked."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_it else None
+    buf, size = [], 0
+    for line in lines:
+        b = line.encode("utf-8")
+        buf.append(b)
+        size += len(b)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = b"".join(buf)
+            buf, size = [], 0
+            data = z.compress(data) if z else data
+            if data:
+                yield data
+    data = b"".join(buf)
+    if z:
+        data = z.compress(data) + z.flush()
+    if data:
+        yield data
+
+def export_response(name, header, rows):
+    """Stream rows as CSV (default) or NDJSON (?format=ndjson), gzip'd when the client accepts it."""
+    fmt = "ndjson" if request.args.get("format") == "ndjson" else "csv"
+    gzip_it = "gzip" in request.accept_encodings and request.args.get("gzip") != "0"
+    resp = Response(stream_with_context(_export_chunks(_export_lines(header, rows, fmt), gzip_it)),
+                    mimetype="application/x-ndjson" if fmt == "ndjson" else "text/csv")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}.{fmt}"'
+    if gzip_it:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+def _export_since():
+    since = request.args.get("since")
+    if not since:
+        return None
+    dt = parse_timestamp(since)
+    if dt is None:
+        abort(400, "since= must be an ISO-8601 date or timestamp")
+    return dt
+
+@app.route("/admin/messages/export")
+def admin_messages_export():
+    if not admin_required():
+        return redirect(url_for("admin_login", next=request.path))
+    return export_response("messages", CONTACT_FIELDS, submissions.iter_since(_export_since()))
+
+@app.route("/admin/feedback/export")
+def admin_feedback_export():
+    if not admin_required():
+        return redirect(url_for("admin_login", next=request.path))
+    return export_response("feedback", FEEDBACK_FIELDS, feedback_store.iter_since(_export_since()))
+
+@app.route("/admin/cache-stats")
+def admin_cache_stats():
+    if not admin_required():
+        return redirect(url_for("admin_login", next=request.path))
+    return {**page_cache.stats(), "rate_limit": form_limiter.stats(),
+            "write_queues": {name: q.stats() for name, q in write_queues.items()}}
+
+@metrics.collector
+def _app_metrics():
+    pc = page_cache.stats()
+    cc = compressed_cache.stats()
+    rl = form_limiter.stats()
+    out = [
+        ("page_cache_requests_total", "counter", "Page cache lookups by result.",
+         [({"result": "hit"}, pc["hits"]), ({"result": "miss"}, pc["misses"])]),
+        ("page_cache_hit_ratio", "gauge", "Page cache hits / lookups.", [({}, pc["hit_ratio"])]),
+        ("page_cache_entries", "gauge", "Pages held in the page cache.", [({}, pc["size"])]),
+        ("compressed_cache_requests_total", "counter", "Precompressed public page lookups by result.",
+         [({"result": "hit"}, cc["hits"]), ({"result": "miss"}, cc["misses"])]),
+        ("testimonials_view_requests_total", "counter", "Testimonials body served from the view vs rebuilt.",
+         [({"result": "hit"}, testimonials_view.hits), ({"result": "rebuild"}, testimonials_view.rebuilds)]),
+        ("rate_limit_decisions_total", "counter", "Form POSTs allowed / rejected by the rate limiter.",
+         [({"result": "allowed"}, rl["allowed"]), ({"result": "rejected"}, rl["rejected"])]),
+        ("places_breaker_open", "gauge", "1 while the Places circuit breaker is open.",
+         [({}, int(_google_breaker.state == "open"))]),
+        ("rate_limit_keys", "gauge", "Client keys tracked by the rate limiter.", [({}, rl["keys"])]),
+    ]
+    if write_queues:
+        qs = {name: q.stats() for name, q in write_queues.items()}
+        out += [
+            ("write_queue_depth", "gauge", "Rows waiting in the write-behind queue.",
+             [({"queue": n}, st["depth"]) for n, st in qs.items()]),
+            ("write_queue_rows_total", "counter", "Rows written by the write-behind thread.",
+             [({"queue": n}, st["written"]) for n, st in qs.items()]),
+            ("write_queue_sync_writes_total", "counter", "Rows written inline because the queue was full.",
+             [({"queue": n}, st["sync_writes"]) for n, st in qs.items()]),
+        ]
+    return out
+
+@app.route("/metrics")
+def metrics_endpoint():
+    token_ok = METRICS_TOKEN and hmac.compare_digest(request.headers.get("Authorization", "").encode(),
+                                                     f"Bearer {METRICS_TOKEN}".encode())
+    if not (token_ok or admin_required()):
+        return redirect(url_for("admin_login", next=request.path))
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# -------- Application factory + warm-up --------
+WARM_PAGES = ("home", "about", "programs", "contact", "thanks", "feedback", "testimonials")
+
+# decided once at import (the metrics hooks are registered then or not at all)
+FIXED_AT_IMPORT = ("METRICS_ENABLED",)
+# what create_app() can set; each one starts from the value read at import
+SETTINGS = (
+    "ADMIN_PASSWORD", "METRICS_TOKEN", "ADMIN_PAGE_SIZE",
+    "CSV_FILE", "FEEDBACK_FILE", "FEEDBACK_EVENTS_FILE", "FEEDBACK_RATINGS_FILE", "FEEDBACK_COMPACT_AFTER",
+    "STORAGE_BACKEND", "SQLITE_FILE", "STORAGE_FSYNC_INTERVAL_SECONDS", "WRITE_BEHIND", "WRITE_BEHIND_QUEUE_SIZE",
+    "GOOGLE_PLACES_API_KEY", "GOOGLE_PLACE_ID", "GOOGLE_MAPS_LINK", "GOOGLE_PLACES_URL",
+    "GOOGLE_CACHE_FILE", "GOOGLE_CACHE_LOCK_FILE", "GOOGLE_CACHE_TTL_SECONDS",
+    "GOOGLE_CONNECT_TIMEOUT_SECONDS", "GOOGLE_FETCH_TIMEOUT_SECONDS",
+    "GOOGLE_BREAKER_FAILURES", "GOOGLE_BACKOFF_BASE_SECONDS", "GOOGLE_BACKOFF_MAX_SECONDS",
+    "PRECOMPILE_TEMPLATES", "PAGE_CACHE_SIZE", "PAGE_CACHE_TTL_SECONDS", "PUBLIC_MAX_AGE_SECONDS", "PUBLIC_SWR_SECONDS",
+    "COMPRESS_ENABLED", "COMPRESS_MIN_BYTES", "COMPRESS_LEVEL", "COMPRESS_CACHE_SIZE", "CRITICAL_CSS",
+    "RATE_LIMIT_PER_MINUTE", "RATE_LIMIT_BURST", "RATE_LIMIT_KEYS", "RATE_LIMIT_SHARED_FILE", "RATE_LIMIT_PROXY_HOPS",
+)
+_SETTING_DEFAULTS = {name: globals()[name] for name in SETTINGS}
+_FLASK_DEFAULTS = dict(app.config)
+
+def create_app(config=None):
+    """
+    Configure and return the app. Its routes are registered at import, so there
+    is one per process, and each call sets its whole configuration: app.config
+    holds every name in SETTINGS (CSV_FILE, STORAGE_BACKEND, WRITE_BEHIND, ...)
+    and Flask's own keys, taken from config or else from the environment as read
+    at import, never from an earlier call. The objects built from the settings
+    (stores and write-behind queues, caches, cache policies, rate limiter,
+    Places client and breaker) are built again. Any other key, or one in
+    FIXED_AT_IMPORT (environment only), raises ValueError. gunicorn can also
+    load it as 'app:create_app()'.
+    """
+    config = dict(config or {})
+    fixed = sorted(set(config) & set(FIXED_AT_IMPORT))
+    if fixed:
+        raise ValueError(f"{', '.join(fixed)} can only be set in the environment (read once at import)")
+    unknown = sorted(k for k in config if k not in _SETTING_DEFAULTS and k not in _FLASK_DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown settings: {', '.join(unknown)}")
+    settings = dict(_SETTING_DEFAULTS)
+    # settings derived from others follow them unless given too
+    if "GOOGLE_CACHE_FILE" in config:
+        settings["GOOGLE_CACHE_LOCK_FILE"] = config["GOOGLE_CACHE_FILE"] + ".lock"
+    if "WRITE_BEHIND" in config and not os.getenv("STORAGE_FSYNC_INTERVAL_SECONDS"):
+        settings["STORAGE_FSYNC_INTERVAL_SECONDS"] = 0.0 if config["WRITE_BEHIND"] else 1.0
+    app.config.clear()
+    app.config.update(_FLASK_DEFAULTS)
+    app.config.update(settings)
+    app.config.update(config)
+    _apply_settings(app.config)
+    return app
+
+def _apply_settings(config):
+    # the code reads settings as module globals; they mirror app.config
+    global page_cache, compressed_cache, form_limiter, _google_breaker, _places, _google_file
+    reset_storage()
+    globals().update({name: config[name] for name in SETTINGS})
+    page_cache = PageCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL_SECONDS)
+    compressed_cache = PageCache(COMPRESS_CACHE_SIZE, PAGE_CACHE_TTL_SECONDS)
+    CACHE_POLICIES["public"] = f"public, max-age={PUBLIC_MAX_AGE_SECONDS}, stale-while-revalidate={PUBLIC_SWR_SECONDS}"
+    form_limiter = make_limiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST, RATE_LIMIT_KEYS, RATE_LIMIT_SHARED_FILE)
+    _google_breaker = CircuitBreaker(GOOGLE_BREAKER_FAILURES, GOOGLE_BACKOFF_BASE_SECONDS, GOOGLE_BACKOFF_MAX_SECONDS)
+    if _places is not None:
+        _places.close()
+        _places = None
+    _google_mem.clear()
+    _google_file = JSONFile(GOOGLE_CACHE_FILE, _read_google_file)
+    ASSETS.clear()
+
+def warm_up(pages=WARM_PAGES):
+    """
+    Do what the first requests would otherwise pay for: open the stores and
+    load the feedback view, build the assets, read the logo, compile every
+    template, pick up the cached Google rating (a stale one refreshes in the
+    background, as on any request) and render the public pages into the page
+    cache. gunicorn.conf.py runs it in each worker before it accepts
+    connections. Returns milliseconds per step.
+    """
+    steps = (
+        ("storage", lambda: (init_storage(), feedback_store.ratings())),
+        ("assets", build_assets),
+        ("logo", logo_asset),
+        ("templates", compile_templates),
+        ("google", fetch_google_rating),
+        ("pages", lambda: _warm_pages(pages)),
+    )
+    timings = {}
+    for name, step in steps:
+        t0 = time.perf_counter()
+        step()
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+    return timings
+
+def _warm_pages(pages):
+    # straight through the view functions (page cache included), not the
+    # request hooks, so warm-up renders don't show up in /metrics
+    for endpoint in pages:
+        with app.test_request_context("/"):
+            path = url_for(endpoint)
+        with app.test_request_context(path):
+            app.view_functions[endpoint]()
+
 # -------- Auto-pick free port + Pythonista-friendly run --------
 
 def find_free_port(start=PREFERRED_PORT_START, end=PREFERRED_PORT_END):
+    import socket
     for p in range(start, end + 1):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             try:
@@ -758,6 +1745,7 @@ def find_free_port(start=PREFERRED_PORT_START, end=PREFERRED_PORT_END):
 if __name__ == "__main__":
     PORT = find_free_port(PREFERRED_PORT_START, PREFERRED_PORT_END) or PREFERRED_PORT_START
     try:
+        import socket
         lan_ip = socket.gethostbyname(socket.gethostname())
     except Exception:
         lan_ip = "127.0.0.1"
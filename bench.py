@@ -0,0 +1,1471 @@
+"""
+Benchmarks for the site.
+
+    python bench.py logo            # page bytes + render time, inline logo vs hashed URL
+    python bench.py templates       # requests/sec per route, precompiled vs per-call compile
+    python bench.py pagecache       # requests/sec per public route, page cache off vs on
+    python bench.py rating          # concurrent page loads against a slow / failing stub Places server
+    python bench.py rating-procs    # several processes hammering render(); asserts one upstream fetch
+    python bench.py submissions     # thousands of parallel contact POSTs; asserts every row intact
+    python bench.py sqlite          # CSV vs SQLite: insert throughput + /testimonials latency by size
+    python bench.py messages        # /admin/messages page latency + streamed "show all" peak memory by size
+    python bench.py export          # streamed CSV/NDJSON(+gzip) export: throughput, asserts flat peak memory (warm + cold)
+    python bench.py search          # inverted index vs linear scan query latency; feedback index catch-up
+    python bench.py writebehind     # contact POST p50/p99 with synchronous appends vs the write-behind queue
+    python bench.py metrics         # per-request cost of the instrumentation (hooks + phase wrappers)
+    python bench.py load            # every route, in-process and under gunicorn -w N, seeded 1k/100k/1M rows
+    python bench.py compress        # bytes on the wire + CPU per request: identity vs gzip/br, cached vs not
+    python bench.py assets          # page weight: first vs repeat visit with hashed CSS/JS, vs the old inline BASE
+    python bench.py places-delay    # gunicorn profiles serving / while Places takes 8s per call: rps per second
+    python bench.py ratelimit       # POST flood from one / many IPs: 429 cost, disk untouched, shared buckets
+    python bench.py records         # feedback rows in memory: dicts vs Feedback records vs columns, 1M rows
+    python bench.py tail            # request latency vs file size: unchanged, after an append, after a rewrite
+    python bench.py ratings         # rating aggregates: per-page cost, per-change update vs a full scan, cold start
+    python bench.py ids             # feedback ids unique across processes/threads; id lookup vs a full reparse
+    python bench.py coldstart       # fresh-process import time (over Flask's), first request cold vs warmed, gunicorn first byte; budgets
+
+Each run happens in a scratch directory (copy of the logo, fresh CSV files) so
+nothing in the repo is touched. Results are printed and appended as one JSON
+line per run to bench_output.txt.
+"""
+import argparse, base64, compileall, csv, glob, http.client, io, json, mimetypes, multiprocessing, os, re, shutil, signal, socket, subprocess, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(HERE, "bench_output.txt")
+
+PAGES = ["/", "/about", "/programs", "/contact", "/thanks", "/feedback", "/testimonials"]
+
+
+def load_app():
+    """Import app.py from inside a scratch dir so its CSV/cache files land there."""
+    work = tempfile.mkdtemp(prefix="littlezs-bench-")
+    for name in glob.glob(os.path.join(HERE, "logo*")):
+        shutil.copy(name, work)
+    os.chdir(work)
+    sys.path.insert(0, HERE)
+    import app
+    app.app.testing = True
+    app.init_storage()
+    app.RATE_LIMIT_PER_MINUTE = 0   # every bench client posts from 127.0.0.1; `ratelimit` turns it back on
+    return app
+
+
+class StubPlaces:
+    """Local stand-in for maps.googleapis.com Place Details."""
+
+    def __init__(self, delay=0.0, fail=False, rating=4.9, count=27):
+        self.delay, self.fail, self.rating, self.count = delay, fail, rating, count
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                if stub.fail:
+                    self.send_response(500); self.end_headers(); return
+                body = json.dumps({"result": {"rating": stub.rating, "user_ratings_total": stub.count}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *a):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.handle_error = lambda request, address: None   # clients hanging up mid-delay
+        self.url = f"http://127.0.0.1:{self.server.server_port}/maps/api/place/details/json"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def use(self, app):
+        app.GOOGLE_PLACES_URL = self.url
+        app.GOOGLE_PLACES_API_KEY = "stub-key"
+        app.GOOGLE_PLACE_ID = "stub-place"
+
+
+# -------- seeded datasets --------
+RELATIONSHIPS = ["Parent", "Guardian", "Relative", "Other"]
+
+
+SEED_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def fake_timestamp(i):
+    """Rows are appended in time order: one per minute from SEED_EPOCH."""
+    return (SEED_EPOCH + timedelta(minutes=i)).isoformat(timespec="seconds")
+
+
+def fake_feedback(i, approved_every=50):
+    return {
+        "id": f"seed{i:08d}", "timestamp": fake_timestamp(i),
+        "name": f"Family {i}", "relationship": RELATIONSHIPS[i % 4], "rating": str(1 + i % 5),
+        "comment": f"Lovely place, comment number {i}.", "can_publish": "yes" if i % 3 else "no",
+        "approved": "yes" if i % approved_every == 0 else "no",
+    }
+
+
+def fake_contact(i):
+    return [fake_timestamp(i), f"Parent {i}",
+            f"parent{i}@example.test", f"516-555-{i % 10000:04d}", f"Hi, tour for my {1 + i % 5} year old? #{i}"]
+
+
+# written to a temp file and swapped in, like a restore would be (new inode)
+def seed_feedback_csv(app, n):
+    with open(app.FEEDBACK_FILE + ".seed", "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=app.FEEDBACK_FIELDS)
+        w.writeheader()
+        w.writerows(fake_feedback(i) for i in range(n))
+    os.replace(app.FEEDBACK_FILE + ".seed", app.FEEDBACK_FILE)
+
+
+def seed_contacts_csv(app, n):
+    with open(app.CSV_FILE + ".seed", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(app.CONTACT_FIELDS)
+        w.writerows(fake_contact(i) for i in range(n))
+    os.replace(app.CSV_FILE + ".seed", app.CSV_FILE)
+
+
+def timed(fn, n):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n
+
+
+def record(name, results):
+    line = {"bench": name, "ts": time.time(), "results": results}
+    with open(OUTPUT, "a", encoding="utf-8") as f:
+        f.write(json.dumps(line) + "\n")
+    print(json.dumps(line, indent=2))
+
+
+# -------- logo --------
+def _inline_logo_data_url():
+    """The pre-asset behaviour: glob + read + base64 on every call."""
+    for name in sorted(glob.glob("logo*")):
+        if os.path.isfile(name):
+            mime = mimetypes.guess_type(name)[0] or "image/png"
+            with open(name, "rb") as f:
+                b64 = base64.b64encode(f.read()).decode("ascii")
+            return f"data:{mime};base64,{b64}"
+    return None
+
+
+def bench_logo(args):
+    app = load_app()
+    client = app.app.test_client()
+    results = {}
+    for path in PAGES:
+        after_bytes = len(client.get(path).data)
+        after_t = timed(lambda: client.get(path), args.n)
+
+        real_url = app.logo_url
+        app.logo_url = lambda logo=None: _inline_logo_data_url()
+        try:
+            before_bytes = len(client.get(path).data)
+            before_t = timed(lambda: client.get(path), args.n)
+        finally:
+            app.logo_url = real_url
+
+        results[path] = {
+            "bytes_before": before_bytes, "bytes_after": after_bytes,
+            "ms_before": round(before_t * 1000, 3), "ms_after": round(after_t * 1000, 3),
+        }
+    record("logo", results)
+
+
+# -------- templates --------
+ADMIN_PAGES = ["/admin/login", "/admin/messages", "/admin/feedback"]
+
+
+def login(client, app):
+    client.post("/admin/login", data={"password": app.ADMIN_PASSWORD})
+
+
+def bench_templates(args):
+    app = load_app()
+    client = app.app.test_client()
+    login(client, app)
+    results = {}
+    for path in PAGES + ADMIN_PAGES:
+        row = {}
+        for mode in (False, True):
+            app.PRECOMPILE_TEMPLATES = mode
+            app._compiled.clear()
+            t = timed(lambda: client.get(path), args.n)
+            row["rps_precompiled" if mode else "rps_per_call"] = round(1 / t, 1)
+        results[path] = row
+    record("templates", results)
+
+
+# -------- pagecache --------
+CACHED_PAGES = ["/", "/about", "/programs", "/contact", "/thanks", "/feedback"]
+
+
+def bench_pagecache(args):
+    app = load_app()
+    client = app.app.test_client()
+    results = {}
+    for path in CACHED_PAGES:
+        row = {}
+        for size in (0, app.PAGE_CACHE_SIZE or 64):
+            app.PAGE_CACHE_SIZE = size
+            app.page_cache.clear()
+            t = timed(lambda: client.get(path), args.n)
+            row["rps_cached" if size else "rps_uncached"] = round(1 / t, 1)
+        results[path] = row
+    results["stats"] = app.page_cache.stats()
+    record("pagecache", results)
+
+
+# -------- rating --------
+def _burst(app, n):
+    """n concurrent GET / (page cache off); returns per-request latencies in ms."""
+    def one(_):
+        client = app.app.test_client()
+        t0 = time.perf_counter()
+        client.get("/")
+        return (time.perf_counter() - t0) * 1000
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return sorted(pool.map(one, range(n)))
+
+
+def _wait_refresh(app, timeout=30):
+    deadline = time.time() + timeout
+    while app._google_refresh["running"] and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def bench_rating(args):
+    app = load_app()
+    app.PAGE_CACHE_SIZE = 0
+    results = {}
+
+    # Cold + expired cache against a slow upstream: nobody waits, one fetch.
+    stub = StubPlaces(delay=args.delay)
+    stub.use(app)
+    lat = _burst(app, args.concurrency)
+    _wait_refresh(app)
+    results["slow_upstream"] = {
+        "upstream_delay_s": args.delay, "requests": len(lat), "upstream_hits": stub.hits,
+        "p50_ms": round(lat[len(lat) // 2], 2), "max_ms": round(lat[-1], 2),
+        "rating_shown": "4.9" in app.app.test_client().get("/").text,
+    }
+
+    # Failing upstream with an expired cache: every failure backs off (a burst
+    # right after it doesn't retry), and after a few the breaker opens.
+    stub.server.shutdown()
+    stub = StubPlaces(fail=True)
+    stub.use(app)
+    with open(app.GOOGLE_CACHE_FILE, "w") as f:
+        json.dump({"rating": 4.9, "count": 27, "_ts": 0}, f)
+    breaker = app._google_breaker = app.CircuitBreaker(app.GOOGLE_BREAKER_FAILURES, 0.2, 3600)
+    retried_early = 0
+    for _ in range(app.GOOGLE_BREAKER_FAILURES):
+        _burst(app, args.concurrency)
+        _wait_refresh(app)
+        hits = stub.hits
+        _burst(app, args.concurrency)
+        _wait_refresh(app)
+        retried_early += stub.hits - hits
+        if breaker.state == "closed":
+            time.sleep(max(0.0, breaker.retry_at - time.time()))
+    results["failing_upstream"] = {
+        "requests": 2 * app.GOOGLE_BREAKER_FAILURES * args.concurrency, "upstream_hits": stub.hits,
+        "retried_during_backoff": retried_early, "breaker": breaker.stats(),
+        "stale_rating_served": "4.9" in app.app.test_client().get("/").text,
+    }
+    assert stub.hits == app.GOOGLE_BREAKER_FAILURES and not retried_early and breaker.state == "open"
+    record("rating", results)
+
+
+def _hammer_render(app, seconds, out):
+    app.PAGE_CACHE_SIZE = 0
+    client = app.app.test_client()
+    n, deadline = 0, time.time() + seconds
+    while time.time() < deadline:
+        client.get("/")
+        n += 1
+    out.put(n)
+
+
+def bench_rating_procs(args):
+    app = load_app()
+    stub = StubPlaces(delay=args.delay)
+    stub.use(app)
+    with open(app.GOOGLE_CACHE_FILE, "w") as f:
+        json.dump({"rating": 4.0, "count": 1, "_ts": 0}, f)   # expired for everyone
+
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_hammer_render, args=(app, args.seconds, out)) for _ in range(args.procs)]
+    for p in procs:
+        p.start()
+    renders = sum(out.get() for _ in procs)
+    for p in procs:
+        p.join()
+
+    results = {"procs": args.procs, "renders": renders, "upstream_hits": stub.hits,
+               "redundant_fetches": max(0, stub.hits - 1)}
+    record("rating-procs", results)
+    assert stub.hits == 1, f"expected exactly one upstream fetch, got {stub.hits}"
+
+
+# -------- submissions --------
+def _post_contacts(app, worker, threads, per_thread, size):
+    def one(t):
+        client = app.app.test_client()
+        for i in range(per_thread):
+            tag = f"w{worker}-t{t}-{i}"
+            # quotes + newlines force CSV quoting; size pushes rows past PIPE_BUF
+            msg = f'{tag} "hi"\n' + (tag[0] * size)
+            client.post("/contact", data={"name": tag, "email": f"{tag}@x.test", "phone": "555", "message": msg})
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(threads)))
+
+
+def bench_submissions(args):
+    app = load_app()
+    ctx = multiprocessing.get_context("fork")
+    t0 = time.perf_counter()
+    procs = [ctx.Process(target=_post_contacts, args=(app, w, args.threads, args.per_thread, args.size))
+             for w in range(args.procs)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+
+    expected = args.procs * args.threads * args.per_thread
+    with open(app.CSV_FILE, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))[1:]
+    bad = [r for r in rows if len(r) != 5 or not r[4].startswith(r[1] + ' "hi"\n') or len(r[4]) != len(r[1]) + 6 + args.size]
+    names = {r[1] for r in rows}
+
+    # torn tail: the next append moves the half row to <file>.torn and starts clean
+    with open(app.CSV_FILE, "ab") as f:
+        f.write(b'2024-01-01,torn,"half a mess')
+    app.submissions.append(["2024-01-01", "after-crash", "a@x.test", "", "ok"])
+    with open(app.CSV_FILE, newline="", encoding="utf-8") as f:
+        after = list(csv.reader(f))
+    tail = after[-1]
+    assert not [r for r in after if r[1] == "torn"], "torn half row kept as a short row"
+    with open(app.CSV_FILE + ".torn", "rb") as f:
+        assert f.read() == b'2024-01-01,torn,"half a mess\n'
+    # a complete last row that only lacks its newline (spreadsheet save) is kept
+    with open(app.CSV_FILE, "ab") as f:
+        f.write(b"2024-01-01,no-newline,b@x.test,,kept")
+    app.submissions.append(["2024-01-01", "after-save", "c@x.test", "", "ok"])
+    with open(app.CSV_FILE, newline="", encoding="utf-8") as f:
+        assert [r[1] for r in list(csv.reader(f))[-2:]] == ["no-newline", "after-save"]
+
+    results = {"posts": expected, "rows": len(rows), "unique": len(names), "bad_rows": len(bad),
+               "posts_per_s": round(expected / elapsed, 1), "row_after_torn_tail": tail[1]}
+    record("submissions", results)
+    assert len(rows) == expected == len(names) and not bad, "lost or torn rows"
+    assert tail[1] == "after-crash"
+
+
+# -------- sqlite --------
+def bench_sqlite(args):
+    import storage
+    app = load_app()
+    client = app.app.test_client()
+    results = {}
+    for n in args.rows:
+        row = {}
+        for backend in ("csv", "sqlite"):
+            if backend == "csv":
+                seed_feedback_csv(app, n)
+                open(app.FEEDBACK_EVENTS_FILE, "w").close()
+                store = storage.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS,
+                                              fsync_interval=app.STORAGE_FSYNC_INTERVAL_SECONDS)
+                store.ensure()
+            else:
+                db_path = f"bench-{n}.db"
+                store = storage.SQLiteFeedback(storage.SQLiteDB(db_path), app.FEEDBACK_FIELDS)
+                store.ensure()
+                store.add_many(fake_feedback(i) for i in range(n))
+            app.feedback_store = store
+            app.testimonials_view = app.TestimonialsView(store)
+
+            t0 = time.perf_counter()
+            for i in range(args.inserts):
+                store.add(fake_feedback(n + i))
+            row[f"{backend}_inserts_per_s"] = round(args.inserts / (time.perf_counter() - t0), 1)
+            row[f"{backend}_testimonials_ms"] = round(timed(lambda: client.get("/testimonials"), args.n) * 1000, 2)
+        results[n] = row
+        print(n, row, flush=True)
+    record("sqlite", results)
+
+
+# -------- messages --------
+def bench_messages(args):
+    app = load_app()
+    client = app.app.test_client()
+    login(client, app)
+    results = {}
+    for n in args.rows:
+        seed_contacts_csv(app, n)
+        t0 = time.perf_counter()
+        client.get("/admin/messages")          # first hit builds the offset index
+        first = time.perf_counter() - t0
+        page = timed(lambda: client.get("/admin/messages"), args.n)
+        deep = timed(lambda: client.get(f"/admin/messages?before={n // 2}"), args.n)
+
+        tracemalloc.start()
+        streamed = 0
+        for chunk in client.get("/admin/messages?all=1", buffered=False).response:
+            streamed += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[n] = {"first_page_ms": round(first * 1000, 2), "page_ms": round(page * 1000, 2),
+                      "middle_page_ms": round(deep * 1000, 2), "show_all_bytes": streamed,
+                      "show_all_peak_mb": round(peak / 1e6, 2)}
+        print(n, results[n], flush=True)
+    record("messages", results)
+
+
+# -------- export --------
+_EXPORT_CHILD = """
+import json, tracemalloc
+import app
+client = app.app.test_client()
+client.post("/admin/login", data={"password": app.ADMIN_PASSWORD})
+tracemalloc.start()
+sent = 0
+for chunk in client.get("/admin/messages/export", buffered=False).response:
+    sent += len(chunk)
+_, peak = tracemalloc.get_traced_memory()
+offsets = app.submissions._offsets.offsets
+print(json.dumps({"bytes": sent, "peak": peak, "index": offsets.itemsize * len(offsets)}))
+"""
+
+
+def _cold_export():
+    """A full CSV export in a fresh process: the offset index is built from the file during the measurement."""
+    out = subprocess.run([sys.executable, "-c", _EXPORT_CHILD], cwd=os.getcwd(), capture_output=True, text=True,
+                         env=dict(os.environ, PYTHONPATH=HERE), check=True).stdout
+    r = json.loads(out.splitlines()[-1])
+    return {"bytes": r["bytes"], "peak_mb": round(r["peak"] / 1e6, 2), "index_mb": round(r["index"] / 1e6, 2)}
+
+
+def _out_of_order_export(app, client):
+    """
+    Batches written late and out of order (a 900-row write-behind batch from
+    before since lands between two runs of newer rows), plus a blank line:
+    the since export must still return every newer row.
+    """
+    since = fake_timestamp(10_000)
+    with open(app.CSV_FILE + ".seed", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(app.CONTACT_FIELDS)
+        w.writerows(fake_contact(i) for i in range(500))
+        w.writerows(fake_contact(10_000 + i) for i in range(100))
+        w.writerows([fake_timestamp(9_995)] + fake_contact(i)[1:] for i in range(900))
+        f.write("\r\n")
+        w.writerows(fake_contact(10_100 + i) for i in range(500))
+    os.replace(app.CSV_FILE + ".seed", app.CSV_FILE)
+    body = client.get(f"/admin/messages/export?since={quote(since)}").get_data(as_text=True)
+    got = len(list(csv.reader(io.StringIO(body)))) - 1
+    assert got == 600, f"out-of-order since export returned {got} rows, expected 600"
+    return got
+
+
+def bench_export(args):
+    app = load_app()
+    client = app.app.test_client()
+    login(client, app)
+    results = {}
+    for n in args.rows:
+        seed_contacts_csv(app, n)
+        client.get("/admin/messages/export?since=2099-01-01")   # build the offset index outside the measurement
+        last_1000 = fake_timestamp(n - 1000)
+        row = {}
+        for label, query, headers in [("csv", "", {}), ("ndjson_gzip", "?format=ndjson", {"Accept-Encoding": "gzip"}),
+                                      ("csv_since_last_1000", f"?since={quote(last_1000)}", {})]:
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            sent = 0
+            for chunk in client.get("/admin/messages/export" + query, headers=headers, buffered=False).response:
+                sent += len(chunk)
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            row[label] = {"bytes": sent, "ms": round(elapsed * 1000, 1), "peak_mb": round(peak / 1e6, 2)}
+        row["csv_cold"] = _cold_export()
+        results[n] = row
+        print(n, row, flush=True)
+    results["out_of_order_since_rows"] = _out_of_order_export(app, client)
+    record("export", results)
+    peaks = [results[n]["csv"]["peak_mb"] for n in args.rows]
+    assert max(peaks) <= 2 * min(peaks) + 1, f"export memory grows with file size: {peaks}"
+    # cold: besides the offset index (8 bytes a row, copied once as it grows) the
+    # file is read a FileTail.CHUNK at a time, so a few chunks bound the rest
+    import storage
+    bound = 4 * storage.FileTail.CHUNK / 1e6 + 1
+    cold = [round(results[n]["csv_cold"]["peak_mb"] - 2 * results[n]["csv_cold"]["index_mb"], 2) for n in args.rows]
+    assert max(cold) <= bound, f"cold export memory grows with file size: {cold} MB (bound {bound} MB)"
+
+
+# -------- search --------
+SEARCH_QUERIES = {
+    "name": "parent 4242", "email_prefix": "parent9999", "phone_tail": "555-0042",
+    "message_word": "year", "no_match": "zebra",
+}
+
+
+def _linear_scan(rows, header, query, limit=50):
+    import search
+    terms = search.tokens(query)
+    hits = []
+    for row in rows:
+        toks = set(search.tokens(" ".join(row)) + search.phone_tokens(row[header.index("phone")]))
+        if all(any(t.startswith(q) for t in toks) for q in terms):
+            hits.append(row)
+    return hits[-limit:][::-1], len(hits)
+
+
+def bench_search(args):
+    import search
+    app = load_app()
+    results = {}
+    for n in args.rows:
+        seed_contacts_csv(app, n)
+        ms = search.MessageSearch(app.submissions, app.CONTACT_FIELDS)
+        t0 = time.perf_counter()
+        ms.search("warmup")
+        build = time.perf_counter() - t0
+        rows = app.submissions.rows()
+        row = {"build_ms": round(build * 1000, 1)}
+        for label, q in SEARCH_QUERIES.items():
+            idx_t = timed(lambda: ms.search(q), args.n)
+            scan_t = timed(lambda: _linear_scan(rows, app.CONTACT_FIELDS, q), 1)
+            assert ms.search(q)[1] == _linear_scan(rows, app.CONTACT_FIELDS, q)[1], label
+            row[label] = {"index_ms": round(idx_t * 1000, 3), "scan_ms": round(scan_t * 1000, 1),
+                          "matches": ms.search(q)[1]}
+
+        # feedback: another worker adds / moderates / deletes, the next query catches up
+        seed_feedback_csv(app, n)
+        store = app.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS)
+        other = app.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS)
+        fs = search.FeedbackSearch(store)
+        t0 = time.perf_counter()
+        fs.search("family")
+        fb = {"build_ms": round((time.perf_counter() - t0) * 1000, 1),
+              "unchanged_ms": round(timed(lambda: fs.search("family"), args.n) * 1000, 3)}
+        for label, change in [("after_append_ms", lambda i: other.add(fake_feedback(n + i))),
+                              ("after_moderation_ms", lambda i: other.moderate(f"seed{i:08d}", "approve")),
+                              ("after_delete_ms", lambda i: other.moderate(f"seed{n // 2 + i:08d}", "delete"))]:
+            lat = []
+            for i in range(20):
+                change(i)
+                t0 = time.perf_counter()
+                fs.search("family")
+                lat.append((time.perf_counter() - t0) * 1000)
+            fb[label] = _p50(lat)
+        fresh = search.FeedbackSearch(store).search("family", limit=n)
+        assert [r.id for r in fs.search("family", limit=n)[0]] == [r.id for r in fresh[0]], "feedback index drifted"
+        row["feedback"] = fb
+        results[n] = row
+        print(n, row, flush=True)
+    record("search", results)
+
+
+# -------- writebehind --------
+def _pct(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))], 3) if values else None
+
+
+def _post_latencies(app, threads, per_thread, tag):
+    def one(t):
+        client = app.app.test_client()
+        lat = []
+        for i in range(per_thread):
+            t0 = time.perf_counter()
+            client.post("/contact", data={"name": f"{tag}-{t}-{i}", "email": "a@x.test", "phone": "555",
+                                          "message": "Tour please " * 20})
+            lat.append((time.perf_counter() - t0) * 1000)
+        return lat
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return [x for lat in pool.map(one, range(threads)) for x in lat]
+
+
+def bench_writebehind(args):
+    """--threads 1 is one sync gunicorn worker; more threads share one GIL with the writer thread."""
+    import storage
+    app = load_app()
+    results = {}
+    modes = [("sync_fsync_1s", 1.0, False), ("sync_fsync_each", 0.0, False), ("write_behind_fsync_each", 0.0, True)]
+    for threads in args.threads:
+        for label, fsync_interval, behind in modes:
+            app.submissions.fsync_interval = fsync_interval
+            queue = storage.WriteBehind(app.submissions.append_many, args.queue, name="bench-writer")
+            app.save_contact = queue.put if behind else app.submissions.append
+            before = app.submissions.count()
+            per_thread = args.posts // threads
+            t0 = time.perf_counter()
+            lat = _post_latencies(app, threads, per_thread, label)
+            elapsed = time.perf_counter() - t0
+            flushed = queue.flush()
+            posts = threads * per_thread
+            row = {"posts": posts, "p50_ms": _pct(lat, 0.5), "p99_ms": _pct(lat, 0.99),
+                   "posts_per_s": round(posts / elapsed, 1), "rows_written": app.submissions.count() - before}
+            if behind:
+                row["queue"] = queue.stats()
+            assert flushed and row["rows_written"] == posts, row
+            results[f"{threads}_threads/{label}"] = row
+            print(threads, label, row, flush=True)
+    record("writebehind", results)
+
+
+# -------- metrics --------
+def bench_metrics(args):
+    import metrics
+    app = load_app()
+    client = app.app.test_client()
+    m = metrics.Metrics()
+    noop = lambda: None
+    wrapped = m.timed("bench", noop)
+    hooks = timed(lambda: (m.start_request("home"), m.end_request(200, 9000)), args.n)
+    phase = timed(wrapped, args.n) - timed(noop, args.n)
+    results = {"request_hooks_us": round(hooks * 1e6, 2), "phase_wrapper_us": round(phase * 1e6, 2)}
+    for path in PAGES:
+        before = sum(sum(h.counts) for h in app.metrics._series["phase_duration_seconds"].values())
+        t = timed(lambda: client.get(path), 200)
+        after = sum(sum(h.counts) for h in app.metrics._series["phase_duration_seconds"].values())
+        phases = (after - before) / 201
+        results[path] = {"request_us": round(t * 1e6, 1), "phases_per_request": round(phases, 1),
+                         "overhead_us": round(hooks * 1e6 + phases * phase * 1e6, 2)}
+    results["scrape_bytes"] = len(app.metrics.render())
+    record("metrics", results)
+
+
+# -------- load --------
+CONTACT_FORM = {"name": "Load Test", "email": "load@example.test", "phone": "516-555-0100",
+                "message": "Could we book a tour for a 3 year old?"}
+FEEDBACK_FORM = {"name": "Load Test", "relationship": "Parent", "rating": "5", "comment": "Wonderful staff."}
+
+
+def _load_routes(n, logo_path):
+    """(label, method, path, form, admin) for every route in app.py."""
+    since = quote(fake_timestamp(max(0, n - 100)))
+    routes = [(p, "GET", p, None, False) for p in PAGES]
+    routes += [
+        ("POST /contact", "POST", "/contact", CONTACT_FORM, False),
+        ("POST /feedback", "POST", "/feedback", FEEDBACK_FORM, False),
+        ("/admin/login", "GET", "/admin/login", None, False),
+        ("/admin/messages", "GET", "/admin/messages", None, True),
+        ("/admin/messages?before", "GET", f"/admin/messages?before={n // 2}", None, True),
+        ("/admin/feedback", "GET", "/admin/feedback", None, True),
+        ("/admin/search", "GET", "/admin/search?q=parent+42", None, True),
+        ("/admin/search?in=feedback", "GET", "/admin/search?in=feedback&q=lovely&rating=5", None, True),
+        ("/admin/messages/export?since", "GET", f"/admin/messages/export?since={since}", None, True),
+        ("/admin/feedback/export?since", "GET", f"/admin/feedback/export?since={since}", None, True),
+        ("/admin/cache-stats", "GET", "/admin/cache-stats", None, True),
+        ("/metrics", "GET", "/metrics", None, True),
+    ]
+    if logo_path:
+        routes.append(("/assets/logo", "GET", logo_path, None, False))
+    return routes
+
+
+class _TestClientSender:
+    def __init__(self, app):
+        self.client = app.app.test_client()
+        self.admin = app.app.test_client()
+        login(self.admin, app)
+
+    def __call__(self, method, path, form, admin):
+        c = self.admin if admin else self.client
+        r = c.open(path, method=method, data=form)
+        return r.status_code, len(r.get_data())
+
+
+class _HTTPSender:
+    """Keep-alive http.client connection; reconnects when a sync worker closes it."""
+
+    def __init__(self, port, cookie):
+        self.port, self.cookie = port, cookie
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+
+    def __call__(self, method, path, form, admin):
+        body = urlencode(form) if form else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if form else {}
+        if admin:
+            headers["Cookie"] = self.cookie
+        for attempt in (0, 1):
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                r = self.conn.getresponse()
+                data = r.read()
+                return r.status, len(data)
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                if attempt:
+                    raise
+
+
+def _admin_cookie(port, password):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("POST", "/admin/login", body=urlencode({"password": password}),
+                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    r = conn.getresponse()
+    r.read()
+    conn.close()
+    return r.getheader("Set-Cookie", "").split(";")[0]
+
+
+def _drive(make_sender, routes, seconds, max_requests, concurrency, warmup):
+    """Run each route for `seconds` (or max_requests) with `concurrency` senders; per-route stats."""
+    senders = [make_sender() for _ in range(concurrency)]
+    out = {}
+    for label, method, path, form, admin in routes:
+        for _ in range(warmup):
+            senders[0](method, path, form, admin)
+        deadline = time.perf_counter() + seconds
+        budget = [max_requests]
+        lock = threading.Lock()
+
+        def worker(send):
+            lat, codes, size = [], {}, 0
+            while time.perf_counter() < deadline:
+                with lock:
+                    if budget[0] <= 0:
+                        break
+                    budget[0] -= 1
+                t0 = time.perf_counter()
+                status, nbytes = send(method, path, form, admin)
+                lat.append((time.perf_counter() - t0) * 1000)
+                codes[status] = codes.get(status, 0) + 1
+                size += nbytes
+            return lat, codes, size
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            parts = list(pool.map(worker, senders))
+        elapsed = time.perf_counter() - t0
+        lat = [x for p in parts for x in p[0]]
+        codes = {}
+        for p in parts:
+            for k, v in p[1].items():
+                codes[str(k)] = codes.get(str(k), 0) + v
+        out[label] = {"requests": len(lat), "rps": round(len(lat) / elapsed, 1),
+                      "p50_ms": _pct(lat, 0.5), "p95_ms": _pct(lat, 0.95), "p99_ms": _pct(lat, 0.99),
+                      "avg_bytes": sum(p[2] for p in parts) // max(1, len(lat)), "status": codes}
+        print(f"  {label:32} {out[label]['rps']:>9} rps  p50 {out[label]['p50_ms']}  "
+              f"p99 {out[label]['p99_ms']} ms  {codes}", flush=True)
+    return out
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _logo_path(html):
+    m = re.search(r'/assets/logo-[0-9a-f]+\.\w+', html)
+    return m.group(0) if m else None
+
+
+def _load_inproc(app, n, args, q):
+    seed_contacts_csv(app, n)
+    seed_feedback_csv(app, n)
+    client = app.app.test_client()
+    routes = _load_routes(n, _logo_path(client.get("/").get_data(as_text=True)))
+    stats = _drive(lambda: _TestClientSender(app), routes, args.seconds, args.max_requests,
+                   args.concurrency, args.warmup)
+    q.put({"routes": stats, "rss_mb": round(_rss_kb(os.getpid()) / 1024, 1)})
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_gunicorn(workers, profile, env):
+    """gunicorn -c gunicorn.conf.py on a free port in the scratch dir; returns (proc, port, html of /)."""
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=HERE, RATE_LIMIT_PER_MINUTE="0", GUNICORN_PROFILE=profile, **env)
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(HERE, "gunicorn.conf.py"),
+                             "-w", str(workers), "-b", f"127.0.0.1:{port}", "--timeout", "600",
+                             "--log-level", "warning", "app:app"], cwd=os.getcwd(), env=env)
+    for _ in range(300):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/")
+            html = conn.getresponse().read().decode("utf-8")
+            conn.close()
+            return proc, port, html
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def _stop_gunicorn(proc):
+    proc.send_signal(signal.SIGTERM)
+    proc.wait(60)
+
+
+def _stub_env(stub):
+    return {"GOOGLE_PLACES_URL": stub.url, "GOOGLE_PLACES_API_KEY": "stub-key", "GOOGLE_PLACE_ID": "stub-place"}
+
+
+def _load_gunicorn(app, n, args, stub):
+    seed_contacts_csv(app, n)
+    seed_feedback_csv(app, n)
+    proc, port, html = _start_gunicorn(args.workers, args.profile, _stub_env(stub))
+    try:
+        cookie = _admin_cookie(port, app.ADMIN_PASSWORD)
+        routes = _load_routes(n, _logo_path(html))
+        stats = _drive(lambda: _HTTPSender(port, cookie), routes, args.seconds, args.max_requests,
+                       args.concurrency, args.warmup * args.workers)
+        pids = [proc.pid] + _children(proc.pid)
+        rss = {"master_mb": round(_rss_kb(proc.pid) / 1024, 1),
+               "workers_mb": [round(_rss_kb(p) / 1024, 1) for p in pids[1:]],
+               "total_mb": round(sum(_rss_kb(p) for p in pids) / 1024, 1)}
+        return {"workers": args.workers, "profile": args.profile, "routes": stats, "rss": rss}
+    finally:
+        _stop_gunicorn(proc)
+
+
+def bench_load(args):
+    app = load_app()
+    stub = StubPlaces()
+    stub.use(app)
+    results = {"concurrency": args.concurrency, "seconds_per_route": args.seconds}
+    ctx = multiprocessing.get_context("fork")
+    for n in args.rows:
+        results[n] = {}
+        if "inproc" in args.mode:
+            # each size runs in a fresh fork, so caches and RSS don't carry over from the last one
+            print(f"{n} rows, in-process", flush=True)
+            q = ctx.Queue()
+            p = ctx.Process(target=_load_inproc, args=(app, n, args, q))
+            p.start()
+            results[n]["inproc"] = q.get()
+            p.join()
+        if "gunicorn" in args.mode:
+            print(f"{n} rows, gunicorn -w {args.workers} ({args.profile})", flush=True)
+            results[n]["gunicorn"] = _load_gunicorn(app, n, args, stub)
+    results["places_stub_hits"] = stub.hits
+    record("load", results)
+
+
+# -------- compress --------
+def _cpu_per_request(fn, n):
+    fn()
+    t0 = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - t0) / n
+
+
+def bench_compress(args):
+    app = load_app()
+    client = app.app.test_client()
+    encodings = ["gzip"] + (["br"] if app.brotli is not None else [])
+    results = {"brotli_available": app.brotli is not None}
+    for path in PAGES:
+        row = {}
+        app.COMPRESS_ENABLED = False
+        row["identity_bytes"] = len(client.get(path).data)
+        row["identity_cpu_us"] = round(_cpu_per_request(lambda: client.get(path), args.n) * 1e6, 1)
+        app.COMPRESS_ENABLED = True
+        for enc in encodings:
+            h = {"Accept-Encoding": enc}
+            r = client.get(path, headers=h)
+            assert r.headers.get("Content-Encoding") == enc, path
+            row[f"{enc}_bytes"] = len(r.data)
+            row[f"{enc}_cpu_us"] = round(_cpu_per_request(lambda: client.get(path, headers=h), args.n) * 1e6, 1)
+            app.compressed_cache.maxsize = 0   # every hit recompresses
+            app.compressed_cache.clear()
+            row[f"{enc}_uncached_cpu_us"] = round(_cpu_per_request(lambda: client.get(path, headers=h), args.n) * 1e6, 1)
+            app.compressed_cache.maxsize = app.COMPRESS_CACHE_SIZE
+        results[path] = row
+        print(path, row, flush=True)
+    login(client, app)
+    r = client.get("/admin/messages", headers={"Accept-Encoding": "gzip"})
+    results["admin_compressed"] = "Content-Encoding" in r.headers
+    assert not results["admin_compressed"]
+    record("compress", results)
+
+
+# -------- assets --------
+def bench_assets(args):
+    import gzip
+    app = load_app()
+    client = app.app.test_client()
+    gz = lambda b: len(gzip.compress(b, 6))
+    with app.app.test_request_context():
+        css_url, js_url = app.asset_url("css"), app.asset_url("js")
+    css, js = client.get(css_url).data, client.get(js_url).data
+    inline = (app.SITE_CSS + app.SITE_JS).encode("utf-8")   # what every page used to carry
+    results = {"css_bytes": len(css), "css_raw_bytes": len(app.SITE_CSS.encode("utf-8")),
+               "js_bytes": len(js), "js_raw_bytes": len(app.SITE_JS.encode("utf-8"))}
+    for path in PAGES:
+        html = client.get(path).data
+        results[path] = {
+            "inline_before_bytes": len(html) + len(inline), "inline_before_gzip": gz(html + inline),
+            "first_visit_bytes": len(html) + len(css) + len(js), "first_visit_gzip": gz(html) + gz(css) + gz(js),
+            "repeat_visit_bytes": len(html), "repeat_visit_gzip": gz(html),
+        }
+    critical = app.critical_css(css.decode("utf-8"))
+    results["critical_css_bytes"] = len(critical)
+    record("assets", results)
+
+
+# -------- places-delay --------
+def bench_places_delay(args):
+    """Every second of the run the rating cache is expired again, so refreshes keep hitting the slow stub."""
+    load_app()
+    results = {"upstream_delay_s": args.delay, "concurrency": args.concurrency}
+    for profile in args.profiles:
+        stub = StubPlaces(delay=args.delay)
+        env = dict(_stub_env(stub), GOOGLE_FETCH_TIMEOUT_SECONDS=str(args.delay + 2), PAGE_CACHE_SIZE="0")
+        proc, port, _ = _start_gunicorn(args.workers, profile, env)
+        senders = [_HTTPSender(port, "") for _ in range(args.concurrency)]
+        stop = time.perf_counter() + args.seconds
+        per_second, lat = {}, []
+        lock = threading.Lock()
+
+        def expire_cache():
+            while time.perf_counter() < stop:
+                with open("google_rating_cache.json", "w") as f:
+                    json.dump({"rating": 4.9, "count": 27, "_ts": 0, "place_id": "stub-place"}, f)
+                time.sleep(1)
+
+        def worker(send):
+            t_start = time.perf_counter()
+            while time.perf_counter() < stop:
+                t0 = time.perf_counter()
+                status, _ = send("GET", "/", None, False)
+                t1 = time.perf_counter()
+                with lock:
+                    lat.append((t1 - t0) * 1000)
+                    sec = int(t1 - t_start)
+                    per_second[sec] = per_second.get(sec, 0) + 1
+
+        try:
+            threading.Thread(target=expire_cache, daemon=True).start()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(worker, senders))
+        finally:
+            _stop_gunicorn(proc)
+            stub.server.shutdown()
+        series = [per_second.get(i, 0) for i in range(int(args.seconds))]
+        results[profile] = {"workers": args.workers, "rps_per_second": series,
+                            "rps_min": min(series), "rps_max": max(series),
+                            "p50_ms": _pct(lat, 0.5), "p99_ms": _pct(lat, 0.99), "max_ms": round(max(lat), 1),
+                            "upstream_calls": stub.hits}
+        print(profile, results[profile], flush=True)
+    record("places-delay", results)
+
+
+# -------- ratelimit --------
+def _flood(app, n, ip_of, forwarded_for=None):
+    """POST n feedback forms; returns (status counts, per-status latencies in ms)."""
+    client = app.app.test_client()
+    codes, lat = {}, {}
+    for i in range(n):
+        headers = {"X-Forwarded-For": forwarded_for(i)} if forwarded_for else {}
+        t0 = time.perf_counter()
+        r = client.post("/feedback", data={"name": f"bot {i}", "rating": "1", "comment": "spam " * 100},
+                        environ_base={"REMOTE_ADDR": ip_of(i)}, headers=headers)
+        lat.setdefault(r.status_code, []).append((time.perf_counter() - t0) * 1000)
+        codes[r.status_code] = codes.get(r.status_code, 0) + 1
+    return codes, lat
+
+
+def _flood_proc(app, n, q):
+    codes, _ = _flood(app, n, lambda i: "203.0.113.9")
+    q.put(codes)
+
+
+def _p50(values):
+    return round(sorted(values)[len(values) // 2], 3) if values else None
+
+
+def bench_ratelimit(args):
+    import ratelimit
+    app = load_app()
+    app.RATE_LIMIT_PER_MINUTE = 3
+    burst = app.RATE_LIMIT_BURST
+    results = {}
+
+    # one IP: only the burst gets through, the rest are 429s that never touch the CSV
+    app.form_limiter = ratelimit.TokenBuckets(3, burst, maxsize=1000)
+    codes, lat = _flood(app, burst, lambda i: "198.51.100.7")
+    size = os.path.getsize(app.FEEDBACK_FILE)
+    codes2, lat2 = _flood(app, args.n, lambda i: "198.51.100.7")
+    results["one_ip"] = {"posts": burst + args.n, "accepted": codes.get(302, 0) + codes2.get(302, 0),
+                         "rejected": codes2.get(429, 0), "accepted_p50_ms": _p50(lat.get(302)),
+                         "rejected_p50_ms": _p50(lat2.get(429)),
+                         "bytes_written_while_rejected": os.path.getsize(app.FEEDBACK_FILE) - size}
+    assert results["one_ip"]["accepted"] == burst and results["one_ip"]["bytes_written_while_rejected"] == 0
+
+    # many IPs: bucket table stays bounded
+    app.form_limiter = ratelimit.TokenBuckets(3, burst, maxsize=1000)
+    _flood(app, args.n, lambda i: f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+    results["many_ips"] = app.form_limiter.stats()
+    assert results["many_ips"]["keys"] <= 1000
+
+    # behind one proxy hop (the router appends the address it saw): rotating a
+    # spoofed X-Forwarded-For prefix doesn't buy a new bucket, while different
+    # clients behind the same router each get their own
+    app.RATE_LIMIT_PROXY_HOPS = 1
+    router = lambda i: "10.1.2.3"
+    app.form_limiter = ratelimit.TokenBuckets(3, burst, maxsize=1000)
+    spoofed, _ = _flood(app, 4 * burst, router, lambda i: f"192.0.2.{i}, 198.51.100.7")
+    app.form_limiter = ratelimit.TokenBuckets(3, burst, maxsize=1000)
+    parents, _ = _flood(app, 8, router, lambda i: f"198.51.100.{i}")
+    app.RATE_LIMIT_PROXY_HOPS = 0
+    results["behind_proxy"] = {"spoofed_accepted": spoofed.get(302, 0), "spoofed_rejected": spoofed.get(429, 0),
+                               "distinct_clients_accepted": parents.get(302, 0)}
+    assert spoofed.get(302, 0) == burst and parents.get(302, 0) == 8, results["behind_proxy"]
+
+    # several worker processes share one mmap'd table: the burst is global, not per worker
+    app.form_limiter = ratelimit.SharedTokenBuckets(os.path.abspath("ratelimit.bin"), 3, burst, slots=1024)
+    ctx = multiprocessing.get_context("fork")
+    q = ctx.Queue()
+    procs = [ctx.Process(target=_flood_proc, args=(app, args.n // args.procs, q)) for _ in range(args.procs)]
+    for p in procs:
+        p.start()
+    totals = {}
+    for _ in procs:
+        for code, c in q.get().items():
+            totals[code] = totals.get(code, 0) + c
+    for p in procs:
+        p.join()
+    results["shared_procs"] = {"procs": args.procs, "accepted": totals.get(302, 0), "rejected": totals.get(429, 0)}
+    assert totals.get(302, 0) == burst, totals
+    record("ratelimit", results)
+
+
+# -------- records --------
+def _build_rows(kind, path):
+    import storage
+    rows = storage.read_complete_csv(path)
+    if kind == "dicts":
+        return list(rows)
+    if kind == "records":
+        return [storage.Feedback.from_row(r) for r in rows]
+    cols = storage.FeedbackColumns()
+    for r in rows:
+        cols.append(r)
+    return cols
+
+
+def bench_records(args):
+    import storage
+    app = load_app()
+    results = {}
+    for n in args.rows:
+        seed_feedback_csv(app, n)
+        row = {}
+        for kind in ("dicts", "records", "columns"):
+            t0 = time.perf_counter()
+            built = _build_rows(kind, app.FEEDBACK_FILE)
+            parse = time.perf_counter() - t0
+            # the two things every page did with dict rows: re-parse ratings, filter + sort published
+            t0 = time.perf_counter()
+            if kind == "dicts":
+                total = sum(int(r.get("rating") or 0) for r in built)
+                pub = sorted((r for r in built if r["approved"] == "yes" and r["can_publish"] == "yes"),
+                             key=lambda r: r["timestamp"], reverse=True)
+            elif kind == "records":
+                total = sum(r.rating for r in built)
+                pub = sorted((r for r in built if r.approved and r.can_publish), key=lambda r: r.ts, reverse=True)
+            else:
+                total = sum(built.rating)
+                want = built.APPROVED | built.CAN_PUBLISH
+                pub = sorted(built.records(None, want, want), key=lambda r: r.ts, reverse=True)
+            use = time.perf_counter() - t0
+            del built
+            tracemalloc.start()
+            built = _build_rows(kind, app.FEEDBACK_FILE)
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del built
+            row[kind] = {"parse_s": round(parse, 2), "held_mb": round(held / 2 ** 20, 1),
+                         "bytes_per_row": round(held / n), "ratings_and_published_ms": round(use * 1000, 1),
+                         "published": len(pub), "rating_sum": total}
+            print(n, kind, row[kind], flush=True)
+        assert len({(v["published"], v["rating_sum"]) for v in row.values()}) == 1, row
+        store = storage.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS)
+        t0 = time.perf_counter()
+        store.count()
+        row["store_cold_load_s"] = round(time.perf_counter() - t0, 2)
+        del store
+        results[f"{n}_rows"] = row
+    record("records", results)
+
+
+# -------- tail --------
+def _rewrite(path):
+    """Copy path over itself (new inode), as a restore would: readers must reload from byte 0."""
+    shutil.copyfile(path, path + ".copy")
+    os.replace(path + ".copy", path)
+
+
+def bench_tail(args):
+    import storage
+    app = load_app()
+    client = app.app.test_client()
+    login(client, app)
+    routes = {"/testimonials": "/testimonials", "/admin/messages": "/admin/messages",
+              "feedback get()": None}
+    results = {}
+    for n in args.rows:
+        seed_feedback_csv(app, n)
+        seed_contacts_csv(app, n)
+        # other workers' writers: same files, separate store objects
+        other_fb = storage.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS)
+        other_sub = storage.AppendOnlyCSV(app.CSV_FILE, app.CONTACT_FIELDS)
+        row = {}
+        for label, path in routes.items():
+            req = (lambda: client.get(path)) if path else (lambda: app.feedback_store.get("seed00000000"))
+            assert path is None or req().status_code == 200
+            unchanged = timed(req, args.n)
+            lat = []
+            for i in range(args.n):
+                other_fb.add(fake_feedback(n + i, approved_every=1))
+                other_sub.append(fake_contact(n + i))
+                t0 = time.perf_counter()
+                req()
+                lat.append((time.perf_counter() - t0) * 1000)
+            rewrite = []
+            for _ in range(3):
+                _rewrite(app.FEEDBACK_FILE)
+                _rewrite(app.CSV_FILE)
+                t0 = time.perf_counter()
+                req()
+                rewrite.append((time.perf_counter() - t0) * 1000)
+            row[label] = {"unchanged_ms": round(unchanged * 1000, 2), "after_append_p50_ms": _pct(lat, 0.5),
+                          "after_append_p99_ms": _pct(lat, 0.99), "after_rewrite_ms": _p50(rewrite)}
+            print(n, label, row[label], flush=True)
+        results[f"{n}_rows"] = row
+    record("tail", results)
+
+
+# -------- ratings --------
+def _scan_ratings(rows):
+    hist = [0] * 5
+    for r in rows:
+        if r.approved and r.can_publish and 1 <= r.rating <= 5:
+            hist[r.rating - 1] += 1
+    return hist
+
+
+def bench_ratings(args):
+    import storage
+    app = load_app()
+    results = {}
+    for n in args.rows:
+        seed_feedback_csv(app, n)
+        for path in (app.FEEDBACK_RATINGS_FILE, app.FEEDBACK_EVENTS_FILE):   # no compaction mid-run
+            if os.path.exists(path):
+                os.remove(path)
+        make = lambda: storage.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS,
+                                             snapshot_path=app.FEEDBACK_RATINGS_FILE)
+        store = make()
+        t0 = time.perf_counter()
+        summary = store.ratings()
+        rebuild = time.perf_counter() - t0
+        assert summary["histogram"] == _scan_ratings(store.rows()), summary
+        per_page = timed(lambda: store.ratings(wait=False), 10_000)
+        scan = timed(lambda: _scan_ratings(store.rows()), 3)
+        ids = [r.id for r in store.rows()[: args.changes]]   # not the records: a million live objects slow every gc pass
+        t0 = time.perf_counter()
+        for fid in ids:   # each change is one append + a tail read + O(1) update
+            store.moderate(fid, "approve")
+            store.ratings()
+        change = (time.perf_counter() - t0) / len(ids)
+        assert store.ratings()["histogram"] == _scan_ratings(store.rows())
+        cold = make()   # a fresh worker: the snapshot matches the files, nothing is parsed
+        t0 = time.perf_counter()
+        assert cold.ratings(wait=False) == store.ratings()
+        snapshot_start = time.perf_counter() - t0
+        assert not cold._loaded
+        results[f"{n}_rows"] = {"per_page_us": round(per_page * 1e6, 2), "rebuild_ms": round(rebuild * 1000, 1),
+                                "full_scan_ms": round(scan * 1000, 1), "change_then_read_us": round(change * 1e6, 1),
+                                "cold_start_from_snapshot_us": round(snapshot_start * 1e6, 1),
+                                "summary": store.ratings()}
+        print(n, results[f"{n}_rows"], flush=True)
+    record("ratings", results)
+
+
+# -------- ids --------
+def _mint_ids(app, n, q):
+    q.put([app.new_feedback_id() for _ in range(n)])
+
+
+def _legacy_feedback(app):
+    """
+    Rows from before ids were unique, and ratings the form never produced: after
+    a delete the next row with the id is reachable, and compaction keeps the
+    rating text as it was.
+    """
+    rows = [fake_feedback(i) for i in range(4)]
+    rows[1]["id"] = rows[2]["id"] = "legacy"
+    rows[1]["rating"], rows[2]["rating"], rows[3]["rating"] = "", "n/a", "7"
+    with open(app.FEEDBACK_FILE + ".seed", "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=app.FEEDBACK_FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+    os.replace(app.FEEDBACK_FILE + ".seed", app.FEEDBACK_FILE)
+    store = app.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS)
+    assert store.get("legacy")["name"] == rows[1]["name"]
+    store.moderate("legacy", "delete")
+    assert store.get("legacy")["name"] == rows[2]["name"], "duplicate id unreachable after a delete"
+    store.moderate("legacy", "approve")
+    assert store.get("legacy")["approved"] == "yes"
+    store.compact()
+    with open(app.FEEDBACK_FILE, newline="", encoding="utf-8") as f:
+        ratings = [r["rating"] for r in csv.DictReader(f)]
+    assert ratings == [rows[0]["rating"], "n/a", "7"], f"compaction changed ratings: {ratings}"
+    return {"duplicate_after_delete": "reachable", "ratings_after_compact": ratings}
+
+
+def bench_ids(args):
+    app = load_app()
+    ctx = multiprocessing.get_context("fork")
+    q = ctx.Queue()
+    procs = [ctx.Process(target=_mint_ids, args=(app, args.n, q)) for _ in range(args.procs)]
+    for p in procs:
+        p.start()
+    per_proc = [q.get() for _ in procs]
+    for p in procs:
+        p.join()
+    with ThreadPoolExecutor(8) as ex:
+        per_thread = list(ex.map(lambda _: [app.new_feedback_id() for _ in range(args.n)], range(8)))
+    minted = [i for ids in per_proc + per_thread for i in ids]
+    assert len(set(minted)) == len(minted), "duplicate id"
+    assert all(ids == sorted(ids) for ids in per_proc + per_thread), "ids out of order"
+    results = {"ids_minted": len(minted), "duplicates": 0, "mint_us": round(timed(app.new_feedback_id, args.n) * 1e6, 2)}
+
+    for n in args.rows:
+        seed_feedback_csv(app, n)
+        store = app.FeedbackStore(app.FEEDBACK_FILE, app.FEEDBACK_EVENTS_FILE, app.FEEDBACK_FIELDS)
+        t0 = time.perf_counter()
+        store.get("seed00000000")
+        first = time.perf_counter() - t0
+        fids = [f"seed{i:08d}" for i in range(0, n, max(1, n // 100))]
+        steady = timed(lambda: store.get(fids[len(fids) // 2]), 1000)
+        t0 = time.perf_counter()
+        for fid in fids:   # another worker moderates, this one looks the row up again
+            store.moderate(fid, "approve")
+            assert store.get(fid)["approved"] == "yes"
+        after_change = (time.perf_counter() - t0) / len(fids)
+        reparse = timed(store._read_view, 3)
+        results[f"{n}_rows"] = {"first_load_ms": round(first * 1000, 1), "get_us": round(steady * 1e6, 2),
+                                "moderate_then_get_us": round(after_change * 1e6, 1),
+                                "full_reparse_ms": round(reparse * 1000, 1)}
+        print(n, results[f"{n}_rows"], flush=True)
+    results["legacy_rows"] = _legacy_feedback(app)
+    record("ids", results)
+
+
+# -------- coldstart --------
+_COLD_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+if sys.argv[1] == "floor":   # what any version of the site pays: Flask and what it pulls in
+    import flask
+    print(json.dumps({"import_ms": (time.perf_counter() - t0) * 1000}))
+    sys.exit()
+import app
+t_import = time.perf_counter() - t0
+out = {"import_ms": t_import * 1000, "modules": sorted(sys.modules)}
+if sys.argv[1] != "import":
+    if sys.argv[1] == "warm":
+        t0 = time.perf_counter()
+        out["warm_up"] = app.warm_up()
+        out["warm_up_ms"] = (time.perf_counter() - t0) * 1000
+    client = app.app.test_client()
+    t0 = time.perf_counter()
+    resp = client.get("/")
+    out["first_request_ms"] = (time.perf_counter() - t0) * 1000
+    out["cache"] = resp.headers.get("X-Page-Cache")
+    assert resp.status_code == 200
+print(json.dumps(out))
+"""
+
+
+def _cold_child(mode, cwd, env):
+    out = subprocess.run([sys.executable, "-c", _COLD_CHILD, mode], cwd=cwd, capture_output=True, text=True,
+                         env=dict(os.environ, PYTHONPATH=HERE, **env), check=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def bench_coldstart(args):
+    app = load_app()
+    stub = StubPlaces()
+    env = _stub_env(stub)
+    results = {}
+
+    # with cached bytecode, as on a deployed dyno (PYTHONDONTWRITEBYTECODE would
+    # otherwise have every child compile the sources)
+    compileall.compile_dir(HERE, maxlevels=0, quiet=1)
+    # import in an empty directory: nothing may be created until storage is opened.
+    # Runs alternate with Flask-only imports, so the budget is on app.py's own
+    # share (its modules, the stdlib it pulls in, the module body) on this machine.
+    empty = tempfile.mkdtemp(prefix="littlezs-import-")
+    imports, floor = [], []
+    for _ in range(args.import_runs):
+        run = _cold_child("import", empty, env)
+        imports.append(run["import_ms"])
+        floor.append(_cold_child("floor", empty, env)["import_ms"])
+    created = os.listdir(empty)
+    assert not created, f"import created files: {created}"
+    unused = [m for m in ("sqlite3", "mmap") if m in run["modules"]]
+    assert not unused, f"import loads modules only other backends use: {unused}"
+    results["import_ms_p50"] = round(_p50(imports), 1)
+    results["flask_import_ms_p50"] = round(_p50(floor), 1)
+    results["own_import_ms_p50"] = round(_p50([a - f for a, f in zip(imports, floor)]), 1)
+    print("import", {k: results[k] for k in ("import_ms_p50", "flask_import_ms_p50", "own_import_ms_p50")}, flush=True)
+
+    seed_contacts_csv(app, args.rows)
+    seed_feedback_csv(app, args.rows)
+    for mode in ("cold", "warm"):
+        runs = [_cold_child(mode, os.getcwd(), env) for _ in range(args.n)]
+        results[mode] = {"first_request_ms_p50": round(_p50([r["first_request_ms"] for r in runs]), 1),
+                         "first_request_cache": runs[-1]["cache"]}
+        if mode == "warm":
+            results[mode]["warm_up_ms_p50"] = round(_p50([r["warm_up_ms"] for r in runs]), 1)
+            results[mode]["warm_up_steps"] = runs[-1]["warm_up"]
+        print(mode, results[mode], flush=True)
+
+    # gunicorn: spawn -> first byte of / (the worker warms up before it accepts, when WARM_UP=1)
+    for warm in ("0", "1"):
+        t0 = time.perf_counter()
+        proc, port, _ = _start_gunicorn(1, "gthread", dict(env, WARM_UP=warm))
+        spawn = time.perf_counter() - t0
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            t0 = time.perf_counter()
+            conn.request("GET", "/testimonials")
+            conn.getresponse().read()
+            testimonials = time.perf_counter() - t0
+            conn.close()
+        finally:
+            _stop_gunicorn(proc)
+        results[f"gunicorn_warm_up_{warm}"] = {"spawn_to_first_byte_ms": round(spawn * 1000, 1),
+                                               "first_testimonials_ms": round(testimonials * 1000, 1)}
+        print(f"gunicorn WARM_UP={warm}", results[f"gunicorn_warm_up_{warm}"], flush=True)
+    stub.server.shutdown()
+
+    over = []
+    if results["own_import_ms_p50"] > args.import_budget_ms:
+        over.append(f"import beyond Flask {results['own_import_ms_p50']} ms > {args.import_budget_ms} ms")
+    if results["warm"]["first_request_ms_p50"] > args.first_byte_budget_ms:
+        over.append(f"first request after warm-up {results['warm']['first_request_ms_p50']} ms"
+                    f" > {args.first_byte_budget_ms} ms")
+    results["budgets"] = {"own_import_ms": args.import_budget_ms, "first_byte_ms": args.first_byte_budget_ms,
+                          "over": over}
+    record("coldstart", results)
+    if over:
+        sys.exit("over budget: " + "; ".join(over))
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="bench", required=True)
+    s = sub.add_parser("logo"); s.add_argument("-n", type=int, default=200); s.set_defaults(fn=bench_logo)
+    s = sub.add_parser("templates"); s.add_argument("-n", type=int, default=300); s.set_defaults(fn=bench_templates)
+    s = sub.add_parser("pagecache"); s.add_argument("-n", type=int, default=500); s.set_defaults(fn=bench_pagecache)
+    s = sub.add_parser("rating"); s.add_argument("--concurrency", type=int, default=50)
+    s.add_argument("--delay", type=float, default=2.0); s.set_defaults(fn=bench_rating)
+    s = sub.add_parser("rating-procs"); s.add_argument("--procs", type=int, default=8)
+    s.add_argument("--seconds", type=float, default=5.0); s.add_argument("--delay", type=float, default=0.5)
+    s.set_defaults(fn=bench_rating_procs)
+    s = sub.add_parser("submissions"); s.add_argument("--procs", type=int, default=4)
+    s.add_argument("--threads", type=int, default=16); s.add_argument("--per-thread", type=int, default=40)
+    s.add_argument("--size", type=int, default=8192); s.set_defaults(fn=bench_submissions)
+    s = sub.add_parser("sqlite"); s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")],
+                                                 default=[10_000, 100_000, 1_000_000])
+    s.add_argument("--inserts", type=int, default=2000); s.add_argument("-n", type=int, default=5)
+    s.set_defaults(fn=bench_sqlite)
+    s = sub.add_parser("messages"); s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")],
+                                                   default=[10_000, 100_000, 1_000_000])
+    s.add_argument("-n", type=int, default=20); s.set_defaults(fn=bench_messages)
+    s = sub.add_parser("export"); s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")],
+                                                 default=[10_000, 100_000, 1_000_000])
+    s.set_defaults(fn=bench_export)
+    s = sub.add_parser("search"); s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")],
+                                                 default=[10_000, 100_000])
+    s.add_argument("-n", type=int, default=200); s.set_defaults(fn=bench_search)
+    s = sub.add_parser("writebehind"); s.add_argument("--threads", type=lambda v: [int(x) for x in v.split(",")],
+                                                      default=[1, 8])
+    s.add_argument("--posts", type=int, default=2000); s.add_argument("--queue", type=int, default=1000)
+    s.set_defaults(fn=bench_writebehind)
+    s = sub.add_parser("metrics"); s.add_argument("-n", type=int, default=100_000); s.set_defaults(fn=bench_metrics)
+    s = sub.add_parser("load"); s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")],
+                                               default=[1_000, 100_000, 1_000_000])
+    s.add_argument("--mode", type=lambda v: v.split(","), default=["inproc", "gunicorn"])
+    s.add_argument("--workers", type=int, default=4); s.add_argument("--concurrency", type=int, default=8)
+    s.add_argument("--profile", default="gthread", choices=["sync", "gthread", "gevent"])
+    s.add_argument("--seconds", type=float, default=2.0); s.add_argument("--max-requests", type=int, default=5000)
+    s.add_argument("--warmup", type=int, default=2); s.set_defaults(fn=bench_load)
+    s = sub.add_parser("compress"); s.add_argument("-n", type=int, default=500); s.set_defaults(fn=bench_compress)
+    s = sub.add_parser("assets"); s.set_defaults(fn=bench_assets)
+    s = sub.add_parser("places-delay"); s.add_argument("--delay", type=float, default=8.0)
+    s.add_argument("--profiles", type=lambda v: v.split(","), default=["sync", "gthread"])
+    s.add_argument("--workers", type=int, default=2); s.add_argument("--concurrency", type=int, default=16)
+    s.add_argument("--seconds", type=float, default=20.0); s.set_defaults(fn=bench_places_delay)
+    s = sub.add_parser("ratelimit"); s.add_argument("-n", type=int, default=2000)
+    s.add_argument("--procs", type=int, default=4); s.set_defaults(fn=bench_ratelimit)
+    s = sub.add_parser("records")
+    s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[100_000, 1_000_000])
+    s.set_defaults(fn=bench_records)
+    s = sub.add_parser("tail"); s.add_argument("-n", type=int, default=50)
+    s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 10_000, 100_000, 1_000_000])
+    s.set_defaults(fn=bench_tail)
+    s = sub.add_parser("ratings"); s.add_argument("--changes", type=int, default=200)
+    s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 100_000, 1_000_000])
+    s.set_defaults(fn=bench_ratings)
+    s = sub.add_parser("ids"); s.add_argument("-n", type=int, default=20000)
+    s.add_argument("--procs", type=int, default=4)
+    s.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 100_000])
+    s.set_defaults(fn=bench_ids)
+    s = sub.add_parser("coldstart"); s.add_argument("-n", type=int, default=5)
+    s.add_argument("--rows", type=int, default=100_000)
+    # import time on top of `import flask`, the median of --import-runs pairs. The
+    # pre-factory app.py took about 5 ms and single medians here range 5-11 ms, so
+    # the budget leaves room for a noisy machine and still catches a heavy import.
+    s.add_argument("--import-runs", type=int, default=15)
+    s.add_argument("--import-budget-ms", type=float, default=20.0)
+    s.add_argument("--first-byte-budget-ms", type=float, default=20.0)
+    s.set_defaults(fn=bench_coldstart)
+    args = p.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
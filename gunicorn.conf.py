@@ -0,0 +1,46 @@
+"""
+gunicorn settings (Procfile: gunicorn -c gunicorn.conf.py app:app).
+
+GUNICORN_PROFILE picks the worker model:
+    gthread (default)  a few processes x GUNICORN_THREADS threads, keep-alive
+    gevent             greenlets with monkey-patched sockets (pip install gevent)
+    sync               one request per process at a time (the old default)
+
+WEB_CONCURRENCY overrides the number of worker processes. Each worker runs
+app.warm_up() before it takes connections (WARM_UP=0 skips it); that counts
+against `timeout`, so very large feedback files may need a bigger one.
+"""
+import multiprocessing, os
+
+profile = os.getenv("GUNICORN_PROFILE", "gthread")
+cpus = multiprocessing.cpu_count()
+
+bind = [f"0.0.0.0:{os.getenv('PORT', '8000')}"]
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+
+if profile == "gevent":
+    worker_class = "gevent"
+    workers = int(os.getenv("WEB_CONCURRENCY", cpus))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "200"))
+elif profile == "sync":
+    worker_class = "sync"
+    workers = int(os.getenv("WEB_CONCURRENCY", 2 * cpus + 1))
+else:
+    # page renders are short and CPU-bound; threads cover the waits (disk, slow clients)
+    worker_class = "gthread"
+    workers = int(os.getenv("WEB_CONCURRENCY", max(2, cpus)))
+    threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+
+def post_worker_init(worker):
+    if os.getenv("WARM_UP", "1") != "0":
+        import app
+        worker.log.info("warm-up (ms): %s", app.warm_up())
+
+
+def worker_exit(server, worker):
+    # write-behind rows still queued in this worker go to disk before it exits
+    import app
+    app.flush_writes()
@@ -0,0 +1,172 @@
+"""
+In-process request metrics, exposed in Prometheus text format.
+
+Histograms have fixed buckets and are updated under one lock, so recording a
+request costs a couple of perf_counter() calls and dict lookups. Phases (rating
+lookup, logo, template, storage) are timed by wrapping the functions that do
+the work; a phase nested inside itself is only counted once. Each gunicorn
+worker keeps its own numbers, like the page cache stats.
+"""
+import bisect, functools, os, threading, time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self, prefix="app", enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._meta = {}         # name -> (type, help, buckets)
+        self._series = {}       # name -> {labels: Histogram | number}
+        self._collectors = []   # fn() -> [(name, type, help, [(labels, value)])]
+        self._local = threading.local()
+        self.histogram("request_duration_seconds", "Time from request start to response (first byte for streams).")
+        self.histogram("response_size_bytes", "Response body size (streamed bodies are not counted).", SIZE_BUCKETS)
+        self.counter("requests_total", "Requests by route and status.")
+        self.histogram("phase_duration_seconds", "Time spent in each phase of a request.")
+
+    # -------- registration --------
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help, buckets)
+        self._series.setdefault(name, {})
+
+    def counter(self, name, help):
+        self._meta[name] = ("counter", help, None)
+        self._series.setdefault(name, {})
+
+    def collector(self, fn):
+        """fn() is called on every scrape and returns [(name, type, help, [(labels dict, value)])]."""
+        self._collectors.append(fn)
+        return fn
+
+    # -------- recording --------
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._series[name]
+            h = series.get(labels)
+            if h is None:
+                h = series[labels] = Histogram(self._meta[name][2])
+            h.observe(value)
+
+    def start_request(self, route):
+        self._local.route = route
+        self._local.t0 = time.perf_counter()
+
+    def end_request(self, status, size):
+        local = self._local
+        t0 = getattr(local, "t0", None)
+        if t0 is None:
+            return
+        local.t0 = None
+        elapsed = time.perf_counter() - t0
+        route = (("route", local.route),)
+        with self._lock:
+            for name, labels, value in (("request_duration_seconds", route, elapsed),
+                                        ("response_size_bytes", route, size)):
+                if value is None:
+                    continue
+                series = self._series[name]
+                h = series.get(labels)
+                if h is None:
+                    h = series[labels] = Histogram(self._meta[name][2])
+                h.observe(value)
+            counts = self._series["requests_total"]
+            key = route + (("status", str(status)),)
+            counts[key] = counts.get(key, 0) + 1
+
+    def timed(self, phase, fn=None):
+        """Decorator (or wrapper, when fn is given) that records fn's run time under phase."""
+        if fn is None:
+            return functools.partial(self.timed, phase)
+        if not self.enabled:
+            return fn
+        local = self._local
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            active = getattr(local, "phases", None)
+            if active is None:
+                active = local.phases = set()
+            if phase in active:
+                return fn(*args, **kwargs)
+            active.add(phase)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                active.discard(phase)
+                labels = (("route", getattr(local, "route", "background")), ("phase", phase))
+                self.observe("phase_duration_seconds", labels, time.perf_counter() - t0)
+        return wrapper
+
+    def instrument(self, obj, phase, *methods):
+        """Time the named methods of one object (e.g. a store) under phase."""
+        for name in methods:
+            if hasattr(obj, name):
+                setattr(obj, name, self.timed(phase, getattr(obj, name)))
+        return obj
+
+    # -------- exposition --------
+    def render(self):
+        p = self.prefix
+        lines = []
+        with self._lock:
+            snapshot = [(name, self._meta[name],
+                         {k: (v.counts[:], v.sum) if isinstance(v, Histogram) else v for k, v in series.items()})
+                        for name, series in self._series.items()]
+        for name, (kind, help, buckets), series in snapshot:
+            lines.append(f"# HELP {p}_{name} {help}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for labels, value in sorted(series.items()):
+                if kind != "histogram":
+                    lines.append(f"{p}_{name}{_labels(labels)} {_num(value)}")
+                    continue
+                counts, total = value
+                running = 0
+                for bound, c in zip(list(buckets) + ["+Inf"], counts):
+                    running += c
+                    le = bound if bound == "+Inf" else _num(bound)
+                    lines.append(f"{p}_{name}_bucket{_labels(labels + (('le', le),))} {running}")
+                lines.append(f"{p}_{name}_sum{_labels(labels)} {_num(total)}")
+                lines.append(f"{p}_{name}_count{_labels(labels)} {running}")
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                lines.append(f"# HELP {p}_{name} {help}")
+                lines.append(f"# TYPE {p}_{name} {kind}")
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{p}_{name}{_labels(tuple(labels.items()))} {_num(value)}")
+        lines.append(f"# HELP {p}_process_info The worker process these numbers belong to.")
+        lines.append(f"# TYPE {p}_process_info gauge")
+        lines.append(f'{p}_process_info{{pid="{os.getpid()}"}} 1')
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v):
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
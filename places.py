@@ -0,0 +1,126 @@
+"""
+Outbound HTTP for the Google Places rating: a small keep-alive connection pool
+with separate connect/read timeouts, and a circuit breaker so a failing
+upstream is left alone for a while instead of being retried on every page view.
+
+Under the gevent worker profile (gunicorn.conf.py) sockets are monkey-patched,
+so a slow call only parks its greenlet.
+"""
+import http.client, json, random, threading, time
+from urllib.parse import urlencode, urlsplit
+
+
+class PlacesClient:
+    def __init__(self, url, connect_timeout=3.0, read_timeout=8.0, pool_size=2):
+        self.url = url
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.path = parts.path or "/"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self._idle = []           # idle keep-alive connections
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def get_json(self, params):
+        """GET path?params and decode the JSON body. Raises on timeouts, non-200s and bad JSON."""
+        target = self.path + "?" + urlencode(params)
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request("GET", target, headers={"Connection": "keep-alive"})
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if attempt:   # a pooled connection the server had already closed: retry once on a fresh one
+                    raise
+                continue
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if resp.status != 200:
+                raise OSError(f"Places returned HTTP {resp.status}")
+            return json.loads(body.decode("utf-8"))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class CircuitBreaker:
+    """
+    Every failure waits a jittered, exponentially growing delay before the next
+    call is let through; after `threshold` consecutive failures the breaker is
+    open. When a delay runs out one trial call decides: success closes it.
+    """
+
+    def __init__(self, threshold=3, base_seconds=30, max_seconds=3600):
+        self.threshold = threshold
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.failures = 0
+        self.retry_at = 0.0
+        self.trial = False        # a trial call after a failure is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.failures < self.threshold:
+            return "closed"
+        return "open" if self.waiting() else "half_open"
+
+    def waiting(self):
+        """True while the delay after the last failure is running."""
+        return time.time() < self.retry_at
+
+    def allow(self):
+        with self._lock:
+            if not self.failures:
+                return True
+            if self.waiting() or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.retry_at = 0.0
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            delay = min(self.max_seconds, self.base_seconds * 2 ** min(self.failures - 1, 32))
+            self.retry_at = time.time() + random.uniform(delay / 2, delay)
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures,
+                "retry_in_s": round(max(0.0, self.retry_at - time.time()), 1)}
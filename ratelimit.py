@@ -0,0 +1,131 @@
+"""
+Token-bucket rate limiting for the public form POSTs.
+
+Each (form, client) key gets a bucket of `burst` tokens refilled continuously
+at `per_minute` tokens a minute, so the allowance slides with time instead of
+resetting on window edges. TokenBuckets keeps the buckets in a bounded LRU
+per worker; SharedTokenBuckets keeps them in a small fixed-size mmap'd file
+so every gunicorn worker on the host draws from the same buckets.
+"""
+import hashlib, os, struct, threading, time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:   # not available everywhere (e.g. Windows); use per-worker buckets there
+    fcntl = None
+
+
+class TokenBuckets:
+    """Per-process buckets; the least recently seen keys are evicted past maxsize."""
+
+    def __init__(self, per_minute, burst, maxsize=10000):
+        self.rate = per_minute / 60.0
+        self.burst = float(burst)
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()   # key -> [tokens, last refill (monotonic)]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def take(self, key):
+        """(True, 0) if a token was taken, else (False, seconds until the next one)."""
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+                b[1] = now
+            return self._spend(b)
+
+    def _spend(self, b):
+        if b[0] >= 1.0:
+            b[0] -= 1.0
+            self.allowed += 1
+            return True, 0
+        self.rejected += 1
+        return False, (1.0 - b[0]) / self.rate if self.rate else 60.0
+
+    def stats(self):
+        with self._lock:
+            return {"pid": os.getpid(), "keys": len(self._buckets), "maxsize": self.maxsize,
+                    "allowed": self.allowed, "rejected": self.rejected}
+
+
+class SharedTokenBuckets(TokenBuckets):
+    """
+    Buckets in a fixed table of `slots` 24-byte records (key hash, tokens, last
+    refill as wall-clock time) in a mmap'd file, shared by every process that
+    opens it. A key probes PROBE slots from its hash; when none is free or its
+    own, the slot refilled longest ago is reused, so the table never grows.
+    """
+    SLOT = struct.Struct("<Qdd")
+    PROBE = 8
+
+    def __init__(self, path, per_minute, burst, slots=4096):
+        super().__init__(per_minute, burst, maxsize=slots)
+        self.path = path
+        self.slots = slots
+        self._pid = None
+
+    def _open(self):
+        # one fd per process: flock() locks are shared by fds inherited across fork
+        if self._pid != os.getpid():
+            import mmap   # only the shared table needs it
+            size = self.slots * self.SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd, self._map, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+        return self._map
+
+    def take(self, key):
+        h = int.from_bytes(hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest(), "little") or 1
+        now = time.time()
+        with self._lock:
+            m = self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot, b = self._find(m, h)
+                if b is None:
+                    b = [self.burst, now]
+                else:
+                    b[0] = min(self.burst, b[0] + max(0.0, now - b[1]) * self.rate)
+                    b[1] = now
+                result = self._spend(b)
+                self.SLOT.pack_into(m, slot * self.SLOT.size, h, b[0], b[1])
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            return result
+
+    def _find(self, m, h):
+        """(slot, [tokens, last]) for h, or (slot to reuse, None)."""
+        victim, oldest = None, None
+        for i in range(self.PROBE):
+            slot = (h + i) % self.slots
+            kh, tokens, last = self.SLOT.unpack_from(m, slot * self.SLOT.size)
+            if kh == h:
+                return slot, [tokens, last]
+            if kh == 0:
+                return slot, None
+            if oldest is None or last < oldest:
+                victim, oldest = slot, last
+        return victim, None
+
+    def stats(self):
+        with self._lock:
+            m = self._open()
+            used = sum(1 for i in range(self.slots) if self.SLOT.unpack_from(m, i * self.SLOT.size)[0])
+            return {"pid": os.getpid(), "keys": used, "maxsize": self.slots, "shared": self.path,
+                    "allowed": self.allowed, "rejected": self.rejected}
+
+
+def make_limiter(per_minute, burst, maxsize=10000, shared_file=""):
+    if shared_file and fcntl is not None:
+        return SharedTokenBuckets(shared_file, per_minute, burst, slots=maxsize)
+    return TokenBuckets(per_minute, burst, maxsize)
@@ -0,0 +1,200 @@
+"""
+In-memory inverted index for the admin search over messages and feedback.
+
+Each index is built on first use and then only catches up: messages are
+append-only, so it reads the store's tail from where it stopped; feedback
+applies the rows added, moderated or deleted since its last look
+(store.changes()), and starts over only when the store does. Every query
+term matches as a prefix, facets filter exactly, and results come back
+newest first.
+"""
+import bisect, heapq, re, threading
+
+_WORD = re.compile(r"\w+")
+
+
+def tokens(text):
+    return _WORD.findall((text or "").casefold())
+
+
+def phone_tokens(text):
+    """Words plus the whole digit string and its local-number tails (so 5550199 finds 516-555-0199)."""
+    words = tokens(text)
+    digits = "".join(ch for ch in (text or "") if ch.isdigit())
+    return words + [digits, digits[-7:], digits[-4:]] if digits else words
+
+
+class InvertedIndex:
+    def __init__(self, facets=()):
+        self.postings = {}                     # token -> set(doc)
+        self.facets = {f: {} for f in facets}  # facet -> value -> set(doc)
+        self.docs = {}                         # doc -> (row, tokens, facet values)
+        self._vocab = []                       # sorted tokens, brought up to date lazily
+        self._vocab_new, self._vocab_gone = [], []
+        self._max_doc = -1
+
+    def add(self, doc, row, toks, facet_values=None):
+        if doc in self.docs:
+            self.remove(doc)
+        toks = set(toks)
+        for t in toks:
+            s = self.postings.get(t)
+            if s is None:
+                s = self.postings[t] = set()
+                self._vocab_new.append(t)
+            s.add(doc)
+        facet_values = facet_values or {}
+        for f, v in facet_values.items():
+            self.facets[f].setdefault(v, set()).add(doc)
+        self.docs[doc] = (row, toks, facet_values)
+        self._max_doc = max(self._max_doc, doc)
+
+    def remove(self, doc):
+        entry = self.docs.pop(doc, None)
+        if entry is None:
+            return
+        _, toks, facet_values = entry
+        for t in toks:
+            s = self.postings[t]
+            s.discard(doc)
+            if not s:
+                del self.postings[t]
+                self._vocab_gone.append(t)
+        for f, v in facet_values.items():
+            self.facets[f][v].discard(doc)
+
+    def _span(self, term):
+        """[i, j) range of vocabulary tokens starting with term."""
+        if self._vocab_new or self._vocab_gone:
+            self._update_vocab()
+        i = bisect.bisect_left(self._vocab, term)
+        j = bisect.bisect_left(self._vocab, term[:-1] + chr(ord(term[-1]) + 1), i)
+        return i, j
+
+    def _update_vocab(self):
+        vocab, postings = self._vocab, self.postings
+        if len(self._vocab_new) + len(self._vocab_gone) > 64:   # bulk load: one sort beats many inserts
+            self._vocab = sorted(postings)
+        else:
+            for t in self._vocab_gone:
+                i = bisect.bisect_left(vocab, t)
+                if i < len(vocab) and vocab[i] == t and t not in postings:
+                    del vocab[i]
+            for t in self._vocab_new:
+                i = bisect.bisect_left(vocab, t)
+                if t in postings and (i == len(vocab) or vocab[i] != t):
+                    vocab.insert(i, t)
+        self._vocab_new, self._vocab_gone = [], []
+
+    def search(self, query, filters=None, limit=50):
+        """(rows newest first, total matches)."""
+        sets, broad = [], []
+        for f, v in (filters or {}).items():
+            sets.append(self.facets.get(f, {}).get(v, set()))
+        for term in tokens(query):
+            i, j = self._span(term)
+            if j - i == 1:
+                sets.append(self.postings[self._vocab[i]])
+            elif j - i == 0:
+                return [], 0
+            else:
+                broad.append((j - i, term, i, j))
+        broad.sort()
+        if not sets and broad:
+            # no selective term: materialize the narrowest prefix
+            _, _, i, j = broad.pop(0)
+            sets.append(set().union(*(self.postings[self._vocab[k]] for k in range(i, j))))
+        if not sets:
+            hits = self.docs.keys()
+        else:
+            sets.sort(key=len)
+            hits = sets[0]
+            for s in sets[1:]:
+                if not hits:
+                    break
+                hits = hits & s
+        for _, term, _, _ in broad:
+            # wide prefixes (e.g. "parent" -> every parent1234 email) are cheaper
+            # to check against the few remaining candidates than to union
+            hits = {d for d in hits if any(t.startswith(term) for t in self.docs[d][1])}
+        return [self.docs[d][0] for d in self._newest(hits, limit)], len(hits)
+
+    def _newest(self, hits, limit):
+        top = self._max_doc
+        if len(hits) * 8 < top:
+            return heapq.nlargest(limit, hits)
+        out = []   # dense result: walking down from the newest doc is cheaper than a heap
+        d = top
+        while d >= 0 and len(out) < limit:
+            if d in hits:
+                out.append(d)
+            d -= 1
+        return out
+
+
+class MessageSearch:
+    """Search over contact submissions (append-only: catch up from the tail)."""
+
+    def __init__(self, store, header):
+        self.store = store
+        self.header = list(header)
+        self.index = InvertedIndex()
+        self._pos = None          # store.tail() cursor; None = not built yet
+        self._next_doc = 0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        rows, pos = self.store.tail(self._pos or 0)
+        if self._pos is not None and pos < self._pos:   # file replaced (restore): start over
+            self.index, self._pos, self._next_doc = InvertedIndex(), None, 0
+            rows, pos = self.store.tail(0)
+        self._pos = pos
+        for row in rows:
+            rec = dict(zip(self.header, row))
+            toks = tokens(rec.get("name")) + tokens(rec.get("email")) + \
+                phone_tokens(rec.get("phone")) + tokens(rec.get("message"))
+            self.index.add(self._next_doc, rec, toks)
+            self._next_doc += 1
+
+    def search(self, query, limit=50):
+        with self._lock:
+            self._sync()
+            return self.index.search(query, limit=limit)
+
+
+class FeedbackSearch:
+    """Search over feedback with rating / approved / relationship facets."""
+    FACETS = ("rating", "approved", "relationship")
+
+    def __init__(self, store):
+        self.store = store
+        self.index = InvertedIndex(self.FACETS)
+        self._cursor = None       # store.changes() cursor
+        self._docs = {}           # feedback id -> doc number (submission order)
+        self._next_doc = 0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        self._cursor, full, records, gone = self.store.changes(self._cursor)
+        if full:
+            self.index, self._docs, self._next_doc = InvertedIndex(self.FACETS), {}, 0
+        for r in records:
+            fid = r.get("id", "")
+            facet_values = {f: r.get(f, "") for f in self.FACETS}
+            doc = self._docs.get(fid)
+            if doc is not None:
+                if self.index.docs[doc][2] != facet_values:   # moderated
+                    self.index.add(doc, r, self.index.docs[doc][1], facet_values)
+                continue
+            doc = self._docs[fid] = self._next_doc
+            self._next_doc += 1
+            self.index.add(doc, r, tokens(r.get("name")) + tokens(r.get("comment")), facet_values)
+        for r in gone:   # deleted
+            doc = self._docs.pop(r.get("id", ""), None)
+            if doc is not None:
+                self.index.remove(doc)
+
+    def search(self, query, filters=None, limit=50):
+        with self._lock:
+            self._sync()
+            return self.index.search(query, filters, limit)
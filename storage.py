@@ -0,0 +1,1309 @@
+"""
+Append-only CSV storage shared by every gunicorn worker.
+
+Writers never rewrite a file: rows are encoded up front and appended under an
+exclusive fcntl lock in a single write, so rows from different workers can't
+interleave. Threads in one worker group-commit (one leader writes everyone's
+pending rows in one locked append) and the file is fsync'd at most every
+fsync_interval seconds.
+
+Readers in every worker keep their own parsed copy and catch up from where
+they left off (FileTail): only appended bytes are parsed, and a file that was
+replaced, truncated or rewritten is read again from the start.
+
+    python storage.py recover contact_submissions.csv   # cut a torn trailing record now
+                                                        # (appends move one to FILE.torn)
+    python storage.py import-sqlite littlezs.db contact_submissions.csv feedback.csv [feedback_events.csv]
+
+SQLiteDB / SQLiteSubmissions / SQLiteFeedback are a drop-in alternative to the
+CSV stores (STORAGE_BACKEND=sqlite in app.py). WriteBehind moves the appends
+off the request thread (WRITE_BEHIND=1 in app.py).
+"""
+import atexit, csv, io, itertools, json, os, queue, random, sys, threading, time
+from datetime import datetime, timedelta
+from array import array
+
+from aggregates import RatingAggregate
+
+try:
+    import fcntl
+except ImportError:   # not available everywhere (e.g. Windows); locks become no-ops
+    fcntl = None
+
+
+CONTACT_FIELDS = ["timestamp", "name", "email", "phone", "message"]
+FEEDBACK_FIELDS = ["id", "timestamp", "name", "relationship", "rating", "comment", "can_publish", "approved"]
+
+
+# -------- File locks --------
+def try_lock_file(path):
+    """Non-blocking exclusive lock on path. Returns a handle for unlock_file(), or None if busy."""
+    f = open(path, "a")
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+def unlock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    handle.close()
+
+def _lock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+def _unlock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+# -------- Small JSON files shared by workers --------
+class JSONFile:
+    """
+    A small JSON document (a cache or snapshot) that every worker reads and any
+    worker may replace. read() parses the file again only when its mtime/size
+    changed; parse, if given, is applied once per change and its result kept.
+    """
+
+    def __init__(self, path, parse=None):
+        self.path = path
+        self.parse = parse
+        self._lock = threading.Lock()
+        self._sig = None    # (mtime_ns, size) when last read
+        self._data = None
+
+    def read(self):
+        """The parsed contents, or None if the file is missing or unreadable."""
+        try:
+            st = os.stat(self.path)
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+        with self._lock:
+            if sig != self._sig:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    self._data = self.parse(data) if self.parse else data
+                except Exception:
+                    self._data = None
+                self._sig = sig
+            return self._data
+
+    def write(self, data):
+        """Replace the contents; failures are ignored (the data can be recomputed)."""
+        try:
+            # temp file + os.replace: readers in other workers never see a torn file
+            tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+
+# -------- CSV encoding / torn-record detection --------
+def encode_rows(rows):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for row in rows:
+        w.writerow(row)
+    return buf.getvalue().encode("utf-8")
+
+def record_ends(data):
+    """Yield the end offset of every complete CSV record in data (newline outside quotes)."""
+    in_quotes = False
+    pos = 0
+    q = data.find(b'"')
+    while True:
+        n = data.find(b"\n", pos)
+        if n == -1:
+            return
+        while q != -1 and q < n:   # each quote is looked at once
+            in_quotes = not in_quotes
+            q = data.find(b'"', q + 1)
+        if not in_quotes:
+            yield n + 1
+        pos = n + 1
+
+def complete_length(data):
+    """Length of the prefix of data made of complete CSV records."""
+    # the last newline with an even number of quotes before it; only a torn
+    # tail record's own newlines are tried, and the counting happens in C
+    n = data.rfind(b"\n")
+    while n != -1:
+        if data.count(b'"', 0, n) % 2 == 0:
+            return n + 1
+        n = data.rfind(b"\n", 0, n)
+    return 0
+
+def parse_rows(data):
+    return list(csv.reader(io.StringIO(data.decode("utf-8"), newline="")))
+
+def recover(path):
+    """Truncate a torn trailing record. Returns the number of bytes removed."""
+    fd = os.open(path, os.O_RDWR)
+    try:
+        _lock_fd(fd)
+        try:
+            return _repair_tail(fd)
+        finally:
+            _unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+def _repair_tail(fd):
+    size = os.fstat(fd).st_size
+    if size == 0 or os.pread(fd, 1, size - 1) == b"\n":
+        return 0
+    data = os.pread(fd, size, 0)
+    keep = complete_length(data)
+    os.ftruncate(fd, keep)
+    return size - keep
+
+def _settle_tail(fd, path, fields):
+    """
+    Bytes to write before an append so it starts on a row of its own. A last
+    record that is only missing its newline (quotes balanced, all `fields`
+    fields, e.g. a file saved by a spreadsheet) gets one. Anything else is
+    the half row of a writer that died mid-append: it is moved to path +
+    ".torn" and cut, rather than completed into a short row.
+    """
+    size = os.fstat(fd).st_size
+    if size == 0 or os.pread(fd, 1, size - 1) == b"\n":
+        return b""
+    data = os.pread(fd, size, 0)
+    keep = complete_length(data)
+    tail = data[keep:]
+    if tail.count(b'"') % 2 == 0:
+        try:
+            rows = parse_rows(tail)
+        except (UnicodeDecodeError, csv.Error):
+            rows = []
+        if len(rows) == 1 and len(rows[0]) == fields:
+            return b"\n"
+    with open(path + ".torn", "ab") as f:
+        f.write(tail + b"\n")
+    os.ftruncate(fd, keep)
+    return b""
+
+
+def parse_timestamp(value):
+    """ISO-8601 string -> aware datetime (naive values are taken as server-local), or None."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo else dt.astimezone()
+
+
+# -------- Record ids --------
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+class RecordIds:
+    """
+    26-character ULID-style ids: 48-bit millisecond timestamp, 16 bits of the
+    process id, then a per-process counter that starts at a random value. They
+    sort in creation order within a process (even if the clock steps back) and
+    by time across processes, and two workers can't mint the same one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def new(self):
+        with self._lock:
+            if self._pid != os.getpid():   # fresh counter after fork
+                self._pid = os.getpid()
+                self._last_ms = 0
+                self._counter = random.getrandbits(62)
+            self._last_ms = max(self._last_ms, int(time.time() * 1000))
+            self._counter += 1
+            value = (self._last_ms << 80) | ((self._pid & 0xFFFF) << 64) | (self._counter & (2 ** 64 - 1))
+        return "".join(_CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+new_record_id = RecordIds().new
+
+
+# -------- Tail reading --------
+class FileTail:
+    """
+    Where a reader left off in an append-only file: its (inode, size, mtime)
+    when last looked at, the end of the last complete record consumed, and the
+    bytes just before that end. new_data() hands back only the complete records
+    appended since, CHUNK bytes or so at a time. A file that was replaced,
+    truncated, or rewritten in place (those bytes no longer match) comes back
+    as a reset, read again from byte 0.
+    """
+    CHECK = 64
+    CHUNK = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.sig = None
+        self.end = 0
+        self.check = b""
+
+    def new_data(self):
+        """
+        (reset, chunks): chunks yields (offset, bytes) pairs of complete
+        records up to the file size seen now, however much is appended while
+        they are read. Use them all up before the next call.
+        """
+        try:
+            st = os.stat(self.path)
+            if (st.st_ino, st.st_size, st.st_mtime_ns) == self.sig:   # unchanged: no open, no read
+                return False, iter(())
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            reset = self.sig is not None
+            self.sig, self.end, self.check = None, 0, b""
+            return reset, iter(())
+        st = os.fstat(f.fileno())
+        sig = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if sig == self.sig:
+            f.close()
+            return False, iter(())
+        reset = self.sig is not None and (st.st_ino != self.sig[0] or st.st_size < self.end
+                                          or self._moved(f))
+        if reset:
+            self.end, self.check = 0, b""
+        return reset, self._chunks(f, sig)
+
+    def _chunks(self, f, sig):
+        with f:
+            f.seek(self.end)
+            pos, size, carry = self.end, sig[1], b""
+            while pos < size:
+                chunk = f.read(min(self.CHUNK, size - pos))
+                if not chunk:   # truncated while we read; the next call sees it
+                    return
+                pos += len(chunk)
+                data = carry + chunk
+                keep = complete_length(data)
+                data, carry = data[:keep], data[keep:]
+                if data:
+                    yield self.end, data
+                    self.check = (self.check + data[-self.CHECK:])[-self.CHECK:]
+                    self.end += len(data)
+        self.sig = sig
+
+    def _moved(self, f):
+        if not self.check:
+            return False
+        f.seek(self.end - len(self.check))
+        return f.read(len(self.check)) != self.check
+
+
+# -------- Row offset index --------
+class RowOffsetIndex:
+    """
+    Byte offset of every record start in a CSV (offsets[0] is the header), so a
+    page of rows is one seek + one read. Extended from where it left off as the
+    file grows; rebuilt only if FileTail reports the file was replaced, truncated
+    or rewritten.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tail = FileTail(path)
+        self.offsets = array("Q")
+
+    def refresh(self):
+        with self._lock:
+            reset, chunks = self._tail.new_data()
+            if reset:
+                self.offsets = array("Q")
+            for base, data in chunks:
+                start = 0
+                for end in record_ends(data):
+                    self.offsets.append(base + start)
+                    start = end
+        return self
+
+    def count(self):
+        """Data rows (header excluded)."""
+        return max(0, len(self.offsets) - 1)
+
+    def read(self, start, stop):
+        """Data rows [start, stop) as lists, oldest first."""
+        offsets, end = self.offsets, self._tail.end
+        if stop <= start:
+            return []
+        lo = offsets[start + 1]
+        hi = offsets[stop + 1] if stop + 1 < len(offsets) else end
+        with open(self.path, "rb") as f:
+            f.seek(lo)
+            return parse_rows(f.read(hi - lo))
+
+
+# -------- Append-only CSV --------
+# A row reaches the file at most this long after its timestamp was taken (a
+# write-behind queue, a blocked lock, another worker's batch). So once a row
+# older than since - WRITE_SKEW is found, every row before it is older than since.
+WRITE_SKEW = timedelta(minutes=10)
+
+def _row_time(row):
+    return parse_timestamp(row[0]) if row else None
+
+def _back_off(index, pos, floor, chunk):
+    """Row number just after the last row before pos stamped earlier than floor (0 if none)."""
+    while pos > 0:
+        begin = max(0, pos - chunk)
+        rows = index.read(begin, pos)
+        for i in range(len(rows) - 1, -1, -1):
+            ts = _row_time(rows[i])
+            if ts is not None and ts < floor:
+                return begin + i + 1
+        pos = begin
+    return 0
+
+
+class AppendOnlyCSV:
+    def __init__(self, path, header, fsync_interval=1.0):
+        self.path = path
+        self.header = list(header)
+        self.fsync_interval = fsync_interval
+        self._cond = threading.Condition()
+        self._pending = []        # [{"data", "done", "error"}] waiting for the next group
+        self._writing = False
+        self._last_fsync = 0.0
+        self._offsets = None      # RowOffsetIndex, built on first page()
+
+    def ensure(self):
+        """Create the file with its header row if it is missing or empty."""
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            _lock_fd(fd)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    _write_all(fd, encode_rows([self.header]))
+            finally:
+                _unlock_fd(fd)
+        finally:
+            os.close(fd)
+
+    def append(self, row):
+        self.append_many([row])
+
+    def rows(self):
+        """All data rows (lists), oldest first; a half-written tail is ignored."""
+        index = self._index().refresh()
+        return index.read(0, index.count())
+
+    def count(self):
+        return self._index().refresh().count()
+
+    def page(self, before=None, limit=50):
+        """
+        Newest-first page of rows ending just before row number `before`.
+        Returns (rows, next_cursor or None, total).
+        """
+        index = self._index().refresh()
+        total = index.count()
+        stop = total if before is None else max(0, min(before, total))
+        start = max(0, stop - limit)
+        rows = index.read(start, stop)
+        rows.reverse()
+        return rows, (start if start > 0 else None), total
+
+    def tail(self, pos=0):
+        """Rows appended after cursor pos (a row count) and the new cursor."""
+        index = self._index().refresh()
+        count = index.count()
+        return index.read(pos, count), count
+
+    def iter_since(self, since=None, chunk=500):
+        """
+        Rows with timestamp >= since (aware datetime), oldest first, chunk rows at a time.
+        Rows are appended roughly in time order, so a binary search finds where since
+        falls; the start then backs off to the last row older than since - WRITE_SKEW.
+        """
+        index = self._index().refresh()
+        stop = index.count()
+        start = 0
+        if since is not None:
+            lo, hi = 0, stop
+            while lo < hi:
+                mid = (lo + hi) // 2
+                ts = _row_time((index.read(mid, mid + 1) or [None])[0])
+                if ts is not None and ts < since:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            start = _back_off(index, lo, since - WRITE_SKEW, chunk)
+        while start < stop:
+            end = min(stop, start + chunk)
+            for row in index.read(start, end):
+                if since is None or ((ts := _row_time(row)) is not None and ts >= since):
+                    yield row
+            start = end
+
+    def iter_newest(self, chunk=500):
+        """Every row, newest first, read chunk rows at a time."""
+        index = self._index().refresh()
+        stop = index.count()
+        while stop > 0:
+            start = max(0, stop - chunk)
+            rows = index.read(start, stop)
+            rows.reverse()
+            yield from rows
+            stop = start
+
+    def _index(self):
+        if self._offsets is None:
+            self._offsets = RowOffsetIndex(self.path)
+        return self._offsets
+
+    def append_many(self, rows):
+        entry = {"data": encode_rows(rows), "done": False, "error": None}
+        with self._cond:
+            self._pending.append(entry)
+            while self._writing and not entry["done"]:
+                self._cond.wait()
+            if not entry["done"]:
+                # we are the leader: write every pending row in one locked append
+                self._writing = True
+                batch, self._pending = self._pending, []
+        if not entry["done"]:
+            error = None
+            try:
+                self._write(b"".join(e["data"] for e in batch))
+            except Exception as e:
+                error = e
+            with self._cond:
+                for e in batch:
+                    e["done"], e["error"] = True, error
+                self._writing = False
+                self._cond.notify_all()
+        if entry["error"] is not None:
+            raise entry["error"]
+
+    def _write(self, data):
+        fd = _open_locked(self.path)
+        try:
+            try:
+                if os.fstat(fd).st_size == 0:
+                    data = encode_rows([self.header]) + data
+                else:   # our first row must not be glued onto an unterminated last one
+                    data = _settle_tail(fd, self.path, len(self.header)) + data
+                _write_all(fd, data)
+                now = time.monotonic()
+                if now - self._last_fsync >= self.fsync_interval:
+                    os.fsync(fd)
+                    self._last_fsync = now
+            finally:
+                _unlock_fd(fd)
+        finally:
+            os.close(fd)
+
+def _open_locked(path):
+    """Open path for append and take its lock, re-opening if a compaction replaced the file meanwhile."""
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        _lock_fd(fd)
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        _unlock_fd(fd)
+        os.close(fd)
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        n = os.write(fd, view)
+        view = view[n:]
+
+
+def read_complete_csv(path):
+    """The complete records of path as dicts (a half-written tail is ignored), read a chunk at a time."""
+    return CSVTail(path).read()[1]
+
+class CSVTail:
+    """Complete records appended to a CSV since the last read(), as dicts (see FileTail)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tail = FileTail(path)
+        self.header = None
+
+    def read(self):
+        """
+        (reset, new rows): reset means earlier rows may be gone and the caller
+        should rebuild. The rows are the ones in the file now; they are read
+        and parsed as they are iterated, so use them up before the next read().
+        """
+        reset, chunks = self._tail.new_data()
+        if reset:
+            self.header = None
+        return reset, self._rows(chunks)
+
+    def _rows(self, chunks):
+        for _, data in chunks:
+            reader = csv.reader(io.StringIO(data.decode("utf-8"), newline=""))
+            if self.header is None:
+                self.header = next(reader, None)
+            header = self.header
+            for r in reader:
+                yield dict(zip(header, r))
+
+    def signature(self):
+        """(inode, size, mtime) of the file as of the last read(), None if it was missing."""
+        return self._tail.sig
+
+
+# -------- Feedback records --------
+class Feedback:
+    """
+    One feedback row with typed fields: int rating (0 = none), bool flags and
+    ts, the timestamp as epoch seconds for sorting. get()/[] return the CSV
+    string forms, so code written against the old dict rows keeps working.
+    """
+    __slots__ = ("id", "timestamp", "ts", "name", "relationship", "rating", "comment", "can_publish", "approved")
+
+    def __init__(self, id, timestamp, ts, name, relationship, rating, comment, can_publish, approved):
+        self.id = id
+        self.timestamp = timestamp
+        self.ts = ts
+        self.name = name
+        self.relationship = relationship
+        self.rating = rating
+        self.comment = comment
+        self.can_publish = can_publish
+        self.approved = approved
+
+    @classmethod
+    def from_row(cls, row):
+        """From a dict of CSV strings."""
+        stamp = row.get("timestamp") or ""
+        return cls(row.get("id") or "", stamp, _epoch(stamp), row.get("name") or "",
+                   row.get("relationship") or "", _rating(row.get("rating")), row.get("comment") or "",
+                   row.get("can_publish") == "yes", row.get("approved") == "yes")
+
+    def get(self, key, default=None):
+        if key in ("can_publish", "approved"):
+            return "yes" if getattr(self, key) else "no"
+        if key == "rating":
+            return str(self.rating) if self.rating else ""
+        if key in FEEDBACK_FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in FEEDBACK_FIELDS:
+            raise KeyError(key)
+        return self.get(key)
+
+    def to_row(self):
+        return {k: self.get(k) for k in FEEDBACK_FIELDS}
+
+    def __repr__(self):
+        return f"Feedback({self.to_row()!r})"
+
+
+def _rating(value):
+    try:
+        return min(5, max(0, int(value)))
+    except (TypeError, ValueError):
+        return 0
+
+def _epoch(stamp):
+    dt = parse_timestamp(stamp)
+    return dt.timestamp() if dt is not None else 0.0
+
+
+class FeedbackColumns:
+    """
+    Feedback rows stored column by column: text in lists, rating and flags in
+    byte arrays, timestamps pre-parsed into a double array, relationship as a
+    code into a small table. Rows are only appended (or flagged in place), so
+    a reader can walk positions below len() without a lock. record(i) builds
+    a Feedback on demand (rows() gives them back as read, for a rewrite).
+    Moderated positions are logged in `moderated`, and
+    `published_changes` counts the changes to the approved + publishable set,
+    so readers can catch up on what changed (FeedbackStore.changes()).
+    """
+    CAN_PUBLISH, APPROVED, DELETED = 1, 2, 4
+    PUBLISHED = CAN_PUBLISH | APPROVED
+
+    def __init__(self):
+        self.ids, self.timestamps, self.names, self.comments = [], [], [], []
+        self.ts = array("d")
+        self.rating = array("B")
+        self.flags = array("B")
+        self.relationship = array("I")
+        self.relationships = []   # code -> relationship string
+        self._codes = {}
+        self.index = {}           # id -> position of its live row (the first, for legacy duplicate ids)
+        self.duplicates = {}      # id -> later live positions with the same id, next first
+        self.raw_ratings = {}     # position -> rating text that _rating() clamped or couldn't read
+        self.live = 0
+        self.ratings = RatingAggregate()   # over approved + publishable rows
+        self.moderated = array("Q")        # position of each applied moderation event, in order
+        self.published_changes = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, row):
+        """Append a dict of CSV strings."""
+        rel = row.get("relationship") or ""
+        code = self._codes.get(rel)
+        if code is None:
+            code = self._codes[rel] = len(self.relationships)
+            self.relationships.append(rel)
+        stamp = row.get("timestamp") or ""
+        self.timestamps.append(stamp)
+        self.ts.append(_epoch(stamp))
+        self.names.append(row.get("name") or "")
+        self.comments.append(row.get("comment") or "")
+        self.relationship.append(code)
+        raw = row.get("rating") or ""
+        rating = _rating(raw)
+        if raw != (str(rating) if rating else ""):
+            self.raw_ratings[len(self.ids)] = raw
+        self.rating.append(rating)
+        flags = ((self.CAN_PUBLISH if row.get("can_publish") == "yes" else 0) |
+                 (self.APPROVED if row.get("approved") == "yes" else 0))
+        self.flags.append(flags)
+        if flags == self.PUBLISHED:
+            self.ratings.add(self.rating[-1])
+            self.published_changes += 1
+        fid = row.get("id") or ""
+        if fid in self.index:
+            self.duplicates.setdefault(fid, []).append(len(self.ids))
+        else:
+            self.index[fid] = len(self.ids)
+        self.ids.append(fid)   # last: len() only counts complete rows
+        self.live += 1
+
+    def moderate(self, fid, action):
+        i = self.index.get(fid)
+        if i is None:
+            return
+        was = self.flags[i] == self.PUBLISHED
+        if was:
+            self.ratings.remove(self.rating[i])
+        if action == "approve":
+            self.flags[i] |= self.APPROVED
+        elif action == "unapprove":
+            self.flags[i] &= ~self.APPROVED
+        elif action == "delete":
+            self.flags[i] |= self.DELETED
+            rest = self.duplicates.get(fid)
+            if rest:   # the next row with this id is the one get()/moderate() reach now
+                self.index[fid] = rest.pop(0)
+                if not rest:
+                    del self.duplicates[fid]
+            else:
+                del self.index[fid]
+            self.live -= 1
+        now = self.flags[i] == self.PUBLISHED
+        if now:
+            self.ratings.add(self.rating[i])
+        if now != was:
+            self.published_changes += 1
+        self.moderated.append(i)
+
+    def record(self, i):
+        f = self.flags[i]
+        return Feedback(self.ids[i], self.timestamps[i], self.ts[i], self.names[i],
+                        self.relationships[self.relationship[i]], self.rating[i], self.comments[i],
+                        bool(f & self.CAN_PUBLISH), bool(f & self.APPROVED))
+
+    def positions(self, stop=None, mask=0, want=0):
+        """Live positions below stop, in submission order; mask/want select on the flag bits."""
+        mask |= self.DELETED
+        stop = len(self) if stop is None else stop
+        select = bytes(int(v & mask == want) for v in range(256))   # flag byte -> 0/1, applied in C
+        return itertools.compress(range(stop), self.flags[:stop].tobytes().translate(select))
+
+    def records(self, stop=None, mask=0, want=0):
+        return [self.record(i) for i in self.positions(stop, mask, want)]
+
+    def rows(self):
+        """Live rows as dicts of CSV strings, the rating as it was read (not clamped)."""
+        for i in self.positions():
+            row = self.record(i).to_row()
+            if i in self.raw_ratings:
+                row["rating"] = self.raw_ratings[i]
+            yield row
+
+
+# -------- Feedback: rows + moderation log, read through a materialized view --------
+EVENT_FIELDS = ["timestamp", "id", "action"]
+MODERATION_ACTIONS = ("approve", "unapprove", "delete")
+
+class FeedbackStore:
+    """
+    New feedback is appended to the rows file; approve/unapprove/delete are
+    appended to a moderation log. Readers get a materialized view (FeedbackColumns,
+    whose id index makes get() and moderation dict lookups) that catches up by
+    reading only what was appended to either file since the last look. Once the log
+    passes compact_after events it is folded into the rows file in the
+    background, and the view is rebuilt once from the compacted file.
+
+    The view also keeps the rating aggregates (ratings()); with snapshot_path
+    they are persisted at most every snapshot_interval seconds (and whenever
+    they change) so a fresh worker can show them before its view is loaded.
+    """
+
+    def __init__(self, path, events_path, fields, fsync_interval=1.0, compact_after=500,
+                 snapshot_path=None, snapshot_interval=30.0):
+        self.path = path
+        self.events_path = events_path
+        self.fields = list(fields)
+        self.compact_after = compact_after
+        self.rows_log = AppendOnlyCSV(path, fields, fsync_interval)
+        self.events_log = AppendOnlyCSV(events_path, EVENT_FIELDS, fsync_interval)
+        self._lock = threading.Lock()
+        self._view = FeedbackColumns()
+        self._rows_tail = CSVTail(path)
+        self._events_tail = CSVTail(events_path)
+        self._events = 0      # moderation events not yet compacted
+        self._generation = 0  # bumped whenever the view is rebuilt from scratch
+        self._compacting = False
+        self._loaded = False
+        self._loading = False
+        self.snapshots = JSONFile(snapshot_path, _snapshot) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        self._saved = (None, None, 0.0)   # (files signature, summary, when) of our last snapshot
+
+    def ensure(self):
+        self.rows_log.ensure()
+        self.events_log.ensure()
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        self.rows_log.append_many([[row.get(k, "") for k in self.fields] for row in rows])
+
+    def moderate(self, fid, action, timestamp=""):
+        if action not in MODERATION_ACTIONS:
+            raise ValueError(f"unknown moderation action: {action!r}")
+        self.events_log.append([timestamp, fid, action])
+        self._refresh()
+        with self._lock:
+            start = self._events >= self.compact_after and not self._compacting
+            if start:
+                self._compacting = True
+        if start:
+            threading.Thread(target=self._compact_in_background, name="feedback-compact", daemon=True).start()
+
+    def get(self, fid):
+        """The Feedback record with this id, or None."""
+        self._refresh()
+        with self._lock:
+            i = self._view.index.get(fid)
+            return self._view.record(i) if i is not None else None
+
+    def _snapshot(self):
+        self._refresh()
+        with self._lock:
+            return self._view, len(self._view)
+
+    def rows(self):
+        """Current Feedback records in submission order."""
+        view, n = self._snapshot()
+        return view.records(n)
+
+    def count(self):
+        self._refresh()
+        return self._view.live
+
+    def iter_since(self, since=None):
+        """Records with timestamp >= since, in submission order (compared on the pre-parsed ts column)."""
+        view, n = self._snapshot()
+        floor = since.timestamp() if since is not None else None
+        ts, flags, deleted = view.ts, view.flags, FeedbackColumns.DELETED
+        for i in range(n):
+            if not flags[i] & deleted and (floor is None or (ts[i] and ts[i] >= floor)):
+                yield view.record(i)
+
+    def changes(self, cursor=None, published=False):
+        """
+        What changed since cursor (returned by an earlier call; None the first
+        time): (cursor, full, records, gone). full means start over: records
+        is every live record. Otherwise records are rows added or moderated
+        since (a record seen before comes back with its new flags) and gone
+        the ones deleted since. With published=True only approved +
+        publishable rows count: a row that stops being one is gone, and
+        nothing is looked at unless that set changed.
+        """
+        self._refresh()
+        with self._lock:
+            view, n, m = self._view, len(self._view), len(self._view.moderated)
+            new = (self._generation, n, m, view.published_changes)
+        want = FeedbackColumns.PUBLISHED if published else 0
+        if cursor is None or cursor[0] != new[0]:
+            return new, True, view.records(n, want, want), []
+        _, n0, m0, p0 = cursor
+        if published and p0 == new[3]:
+            return new, False, [], []
+        mask = want | FeedbackColumns.DELETED
+        flags, records, gone = view.flags, [], []
+        for i in range(n0, n):
+            if flags[i] & mask == want:
+                records.append(view.record(i))
+        for i in dict.fromkeys(view.moderated[m0:m]):
+            if i < n0:
+                (records if flags[i] & mask == want else gone).append(view.record(i))
+        return new, False, records, gone
+
+    def ratings(self, wait=True):
+        """
+        Count / average / histogram of approved + publishable ratings. Until this
+        worker has loaded its view, a snapshot taken from the same files is used
+        as is; with wait=False an out-of-date one (or None) is returned while the
+        view loads in the background instead of loading it on this request.
+        """
+        if not self._loaded and self.snapshots is not None:
+            files, summary = self.snapshots.read() or (None, None)
+            if files is not None and files == self._signature():
+                return summary
+            if not wait:
+                self._load_in_background()
+                return summary
+        self._refresh()
+        with self._lock:
+            files = (self._rows_tail.signature(), self._events_tail.signature())
+            summary = self._view.ratings.summary()
+        self._save_snapshot(files, summary)
+        return summary
+
+    def _save_snapshot(self, files, summary):
+        if self.snapshots is None:
+            return
+        saved_files, saved_summary, when = self._saved
+        now = time.monotonic()
+        if summary != saved_summary or (files != saved_files and now - when >= self.snapshot_interval):
+            self._saved = (files, summary, now)
+            self.snapshots.write({"files": files, "summary": summary})
+
+    def _load_in_background(self):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        def load():
+            try:
+                self.ratings()
+            finally:
+                self._loading = False
+        threading.Thread(target=load, name="feedback-load", daemon=True).start()
+
+    def _signature(self):
+        sig = []
+        for p in (self.path, self.events_path):
+            try:
+                st = os.stat(p)
+                sig.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def _refresh(self):
+        with self._lock:
+            # events first: every event refers to a row written before it, so
+            # rows read after the events always include their targets (read()
+            # fixes how far each file is read when it is called)
+            events_reset, events = self._events_tail.read()
+            rows_reset, rows = self._rows_tail.read()
+            if events_reset or rows_reset:   # compacted, restored or truncated: start over
+                self._view, self._events = FeedbackColumns(), 0
+                self._generation += 1
+                self._rows_tail, self._events_tail = CSVTail(self.path), CSVTail(self.events_path)
+                _, events = self._events_tail.read()
+                _, rows = self._rows_tail.read()
+            for row in rows:
+                self._view.append(row)
+            for ev in events:
+                self._view.moderate(ev.get("id", ""), ev.get("action"))
+                self._events += 1
+            self._loaded = True
+
+    def _read_view(self):
+        view = FeedbackColumns()
+        for row in read_complete_csv(self.path):
+            view.append(row)
+        events = list(read_complete_csv(self.events_path))
+        for ev in events:
+            view.moderate(ev.get("id", ""), ev.get("action"))
+        return view, len(events)
+
+    def compact(self):
+        """Fold the moderation log into the rows file (atomic rewrite) and empty the log. Ratings are written back as read."""
+        rows_fd = _open_locked(self.path)
+        try:
+            events_fd = _open_locked(self.events_path)
+            try:
+                view, _ = self._read_view()
+                tmp = f"{self.path}.{os.getpid()}.compact.tmp"
+                with open(tmp, "w", newline="", encoding="utf-8") as f:
+                    w = csv.DictWriter(f, fieldnames=self.fields, extrasaction="ignore")
+                    w.writeheader()
+                    w.writerows(view.rows())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                # replaying the log again would be harmless (events are idempotent)
+                os.ftruncate(events_fd, 0)
+                _write_all(events_fd, encode_rows([EVENT_FIELDS]))
+            finally:
+                _unlock_fd(events_fd)
+                os.close(events_fd)
+        finally:
+            _unlock_fd(rows_fd)
+            os.close(rows_fd)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._compacting = False
+
+
+def _snapshot(data):
+    """(files signature, summary) from a saved ratings snapshot; JSON turned the signature tuples into lists."""
+    return tuple(tuple(s) if s is not None else None for s in data["files"]), data["summary"]
+
+
+# -------- Write-behind queue --------
+_STOP = object()   # queued by close(): the writer thread exits
+
+def _take_all(q):
+    rows = []
+    while True:
+        try:
+            rows.append(q.get_nowait())
+        except queue.Empty:
+            return rows
+
+class WriteBehind:
+    """
+    Bounded queue in front of a store's append_many(): put() returns as soon as
+    the row is queued and a writer thread commits whatever has piled up as one
+    batch. A full queue blocks put() for up to put_timeout seconds, then the
+    row is written on the caller's thread, so rows are never dropped.
+    Pending rows are flushed at interpreter exit, or by close().
+    """
+
+    def __init__(self, write_many, maxsize=1000, batch=500, put_timeout=0.5, name="write-behind"):
+        self.write_many = write_many
+        self.maxsize = maxsize
+        self.batch = batch
+        self.put_timeout = put_timeout
+        self.name = name
+        self._pid = None
+        self._stopped = False     # the writer thread has exited (close())
+        self._start_lock = threading.Lock()
+        self.enqueued = self.written = self.batches = self.max_depth = self.sync_writes = self.errors = 0
+        atexit.register(self.flush)
+
+    def _queue(self):
+        # the writer thread doesn't survive fork(): each worker gets its own queue + thread
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._q = queue.Queue(self.maxsize)
+                    self._stopped = False
+                    threading.Thread(target=self._run, args=(self._q,), name=self.name, daemon=True).start()
+                    self._pid = os.getpid()
+        return self._q
+
+    def put(self, row):
+        q = self._queue()
+        try:
+            q.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            self.sync_writes += 1
+            self.write_many([row])
+            return
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, q.qsize())
+        if self._stopped:   # closed while the row went in: the writer won't see it
+            self._write(q, _take_all(q))
+
+    def _run(self, q):
+        while True:
+            rows = [q.get()]
+            while len(rows) < self.batch:
+                try:
+                    rows.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            if any(r is _STOP for r in rows):
+                # set before the last look at the queue, so a put() that comes
+                # later sees it and writes its own row
+                self._stopped = True
+                self._write(q, rows + _take_all(q))
+                return
+            self._write(q, rows)
+
+    def _write(self, q, rows):
+        taken = len(rows)
+        rows = [r for r in rows if r is not _STOP]
+        while rows:
+            try:
+                self.write_many(rows)
+                break
+            except Exception as e:   # keep the rows and retry; put() falls back to sync writes meanwhile
+                self.errors += 1
+                print(f"{self.name}: write failed, retrying: {e!r}", file=sys.stderr)
+                time.sleep(1.0)
+        if rows:
+            self.written += len(rows)
+            self.batches += 1
+        for _ in range(taken):
+            q.task_done()
+
+    def close(self, timeout=10.0):
+        """Flush, stop the writer thread and drop the exit hook, for a queue that is being replaced."""
+        atexit.unregister(self.flush)
+        done = self.flush(timeout)
+        if self._pid == os.getpid():
+            self._q.put(_STOP)
+        return done
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far is written. Returns False on timeout."""
+        if self._pid != os.getpid():
+            return True
+        q = self._q
+        deadline = time.monotonic() + timeout
+        with q.all_tasks_done:
+            while q.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                q.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        depth = self._q.qsize() if self._pid == os.getpid() else 0
+        return {"depth": depth, "maxsize": self.maxsize, "max_depth": self.max_depth,
+                "enqueued": self.enqueued, "written": self.written, "batches": self.batches,
+                "sync_writes": self.sync_writes, "errors": self.errors}
+
+
+# -------- SQLite backend (optional) --------
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    timestamp TEXT, name TEXT, email TEXT, phone TEXT, message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions(timestamp);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id TEXT, timestamp TEXT, name TEXT, relationship TEXT, rating TEXT,
+    comment TEXT, can_publish TEXT, approved TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_id ON feedback(id);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback(timestamp);
+CREATE INDEX IF NOT EXISTS idx_feedback_published ON feedback(approved, can_publish, timestamp);
+
+-- bumped in the same transaction as every feedback write (SQLiteFeedback._version())
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('feedback_version', 0);
+"""
+
+class SQLiteDB:
+    """One connection per thread (and per process after a fork), WAL so readers never block the writer."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None or self._local.pid != os.getpid():
+            import sqlite3   # only the sqlite backend pays for it
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            c.row_factory = sqlite3.Row
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = c, os.getpid()
+        return c
+
+    def ensure(self):
+        self.conn().executescript(SQLITE_SCHEMA)
+
+class SQLiteSubmissions:
+    def __init__(self, db, header):
+        self.db = db
+        self.header = list(header)
+
+    def ensure(self):
+        self.db.ensure()
+
+    def append(self, row):
+        self.append_many([row])
+
+    def append_many(self, rows):
+        c = self.db.conn()
+        with c:
+            c.execute("BEGIN")
+            c.executemany("INSERT INTO submissions VALUES (?,?,?,?,?)", rows)
+
+    def rows(self):
+        return [list(r) for r in self.db.conn().execute("SELECT * FROM submissions ORDER BY rowid")]
+
+    def page(self, before=None, limit=50):
+        """Same contract as AppendOnlyCSV.page(); the cursor is a rowid."""
+        c = self.db.conn()
+        total = c.execute("SELECT count(*) FROM submissions").fetchone()[0]
+        found = c.execute("SELECT rowid, * FROM submissions WHERE rowid < ? ORDER BY rowid DESC LIMIT ?",
+                          (before if before is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        more = len(found) > limit
+        found = found[:limit]
+        return [list(r)[1:] for r in found], (found[-1][0] if more and found else None), total
+
+    def count(self):
+        return self.db.conn().execute("SELECT count(*) FROM submissions").fetchone()[0]
+
+    def tail(self, pos=0):
+        """Rows after cursor pos (a rowid) and the new cursor."""
+        found = self.db.conn().execute("SELECT rowid, * FROM submissions WHERE rowid > ? ORDER BY rowid", (pos,)).fetchall()
+        return [list(r)[1:] for r in found], (found[-1][0] if found else pos)
+
+    def iter_since(self, since=None, chunk=500):
+        yield from _iter_since(self.db, "submissions", since, chunk, list)
+
+    def iter_newest(self, chunk=500):
+        before = None
+        while True:
+            rows, before, _ = self.page(before, chunk)
+            yield from rows
+            if before is None:
+                return
+
+class SQLiteFeedback:
+    def __init__(self, db, fields):
+        self.db = db
+        self.fields = list(fields)
+        self._ratings = None   # (version, summary)
+
+    def ensure(self):
+        self.db.ensure()
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        c = self.db.conn()
+        with c:
+            c.execute("BEGIN")
+            c.executemany("INSERT INTO feedback VALUES (?,?,?,?,?,?,?,?)",
+                          ([r.get(k, "") for k in self.fields] for r in rows))
+            c.execute(_BUMP_VERSION)
+
+    def moderate(self, fid, action, timestamp=""):
+        if action not in MODERATION_ACTIONS:
+            raise ValueError(f"unknown moderation action: {action!r}")
+        first = "(SELECT rowid FROM feedback WHERE id = ? ORDER BY rowid LIMIT 1)"
+        c = self.db.conn()
+        with c:
+            c.execute("BEGIN")
+            if action == "delete":
+                c.execute(f"DELETE FROM feedback WHERE rowid = {first}", (fid,))
+            else:
+                c.execute(f"UPDATE feedback SET approved = ? WHERE rowid = {first}",
+                          ("yes" if action == "approve" else "no", fid))
+            c.execute(_BUMP_VERSION)
+
+    def _version(self):
+        """A counter kept in the database, so values read on any thread or in any process compare."""
+        return self.db.conn().execute("SELECT value FROM meta WHERE key = 'feedback_version'").fetchone()[0]
+
+    def get(self, fid):
+        r = self.db.conn().execute("SELECT * FROM feedback WHERE id = ? ORDER BY rowid LIMIT 1", (fid,)).fetchone()
+        return _feedback(r) if r else None
+
+    def rows(self):
+        return [_feedback(r) for r in self.db.conn().execute("SELECT * FROM feedback ORDER BY rowid")]
+
+    def count(self):
+        return self.db.conn().execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+
+    def iter_since(self, since=None, chunk=500):
+        yield from _iter_since(self.db, "feedback", since, chunk, _feedback)
+
+    def changes(self, cursor=None, published=False):
+        """Same contract as FeedbackStore.changes(); the cursor is _version(), and any change starts over."""
+        version = self._version()
+        if version == cursor:
+            return cursor, False, [], []
+        if not published:
+            return version, True, self.rows(), []
+        return version, True, [_feedback(r) for r in self.db.conn().execute(
+            "SELECT * FROM feedback WHERE approved = 'yes' AND can_publish = 'yes' ORDER BY timestamp DESC")], []
+
+    def ratings(self, wait=True):
+        """Same contract as FeedbackStore.ratings(); recounted (over the published index) only when _version() changes."""
+        version = self._version()
+        cached = self._ratings
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        agg = RatingAggregate()
+        for rating, n in self.db.conn().execute(
+                "SELECT rating, COUNT(*) FROM feedback WHERE approved = 'yes' AND can_publish = 'yes' GROUP BY rating"):
+            agg.add(_rating(rating), n)
+        self._ratings = (version, agg.summary())
+        return self._ratings[1]
+
+_BUMP_VERSION = "UPDATE meta SET value = value + 1 WHERE key = 'feedback_version'"
+
+def _feedback(r):
+    return Feedback.from_row(dict(r))
+
+def _iter_since(db, table, since, chunk, shape):
+    # timestamps are stored as written (local ISO strings). The indexed string
+    # comparison narrows the scan with a day of slack for offset/DST changes,
+    # and the parsed comparison below makes it exact.
+    if since is None:
+        cur = db.conn().execute(f"SELECT * FROM {table} ORDER BY rowid")
+    else:
+        floor = (since.astimezone() - timedelta(days=1)).isoformat(timespec="seconds")
+        cur = db.conn().execute(f"SELECT * FROM {table} WHERE timestamp >= ? ORDER BY rowid", (floor,))
+    while True:
+        batch = cur.fetchmany(chunk)
+        if not batch:
+            return
+        for r in batch:
+            if since is None or ((ts := parse_timestamp(r["timestamp"])) is not None and ts >= since):
+                yield shape(r)
+
+def import_csv_to_sqlite(db_path, contact_csv, feedback_csv, events_csv=None):
+    """One-shot import of the CSV stores (moderation log applied). Returns (submissions, feedback) counts."""
+    db = SQLiteDB(db_path)
+    db.ensure()
+    sub_rows = AppendOnlyCSV(contact_csv, CONTACT_FIELDS).rows()
+    fb_rows = FeedbackStore(feedback_csv, events_csv or os.devnull, FEEDBACK_FIELDS).rows()
+    SQLiteSubmissions(db, CONTACT_FIELDS).append_many(sub_rows)
+    SQLiteFeedback(db, FEEDBACK_FIELDS).add_many(fb_rows)
+    return len(sub_rows), len(fb_rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "recover":
+        removed = recover(sys.argv[2])
+        print(f"{sys.argv[2]}: removed {removed} byte(s) of torn trailing record" if removed
+              else f"{sys.argv[2]}: clean")
+    elif len(sys.argv) in (5, 6) and sys.argv[1] == "import-sqlite":
+        n_sub, n_fb = import_csv_to_sqlite(*sys.argv[2:])
+        print(f"{sys.argv[2]}: imported {n_sub} submission(s), {n_fb} feedback row(s)")
+    else:
+        sys.exit("usage: python storage.py recover FILE.csv\n"
+                 "       python storage.py import-sqlite DB CONTACT.csv FEEDBACK.csv [EVENTS.csv]")